@@ -0,0 +1,79 @@
+"""
+ Compare the CPU time and the size of the audio encoders
+
+ Usage: python audio_encoder_benchmark.py [16 kHz 16 bit mono wav file]
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import math
+import random
+import struct
+import sys
+import time
+import wave
+
+from respeaker.audio_encoder import ENCODERS, create_encoder, encode
+
+try: # Python 3
+    cpu_time = time.process_time
+except AttributeError: # Python 2
+    cpu_time = time.clock
+
+CHUNK_BYTES = 1024
+SAMPLE_RATE = 16000
+
+
+def synthesize(seconds=5):
+    # a vowel-like harmonic sound with noise
+    random.seed(0)
+    samples = []
+    for i in range(seconds * SAMPLE_RATE):
+        t = float(i) / SAMPLE_RATE
+        value = sum(math.sin(2 * math.pi * 150 * k * t) / k for k in range(1, 8)) * 4000
+        samples.append(int(value * (0.6 + 0.4 * math.sin(2 * math.pi * 3 * t)) + random.gauss(0, 200)))
+
+    return struct.pack('<%dh' % len(samples), *samples)
+
+
+def main():
+    if len(sys.argv) > 1:
+        w = wave.open(sys.argv[1], 'rb')
+        audio = w.readframes(w.getnframes())
+        w.close()
+    else:
+        audio = synthesize()
+
+    seconds = float(len(audio)) / 2 / SAMPLE_RATE
+    chunks = [audio[i:i + CHUNK_BYTES] for i in range(0, len(audio), CHUNK_BYTES)]
+
+    print('{:<6} {:>10} {:>8} {:>10} {:>12}'.format('codec', 'bytes', 'ratio', 'kbit/s', 'cpu ms / s'))
+    for codec in sorted(ENCODERS):
+        encoder = create_encoder(codec)
+        if encoder.codec != codec:
+            print('{:<6} not available'.format(codec))
+            continue
+
+        start = cpu_time()
+        size = sum(len(data) for data in encode(chunks, encoder))
+        elapsed = cpu_time() - start
+
+        print('{:<6} {:>10} {:>8.2f} {:>10.1f} {:>12.2f}'.format(
+            codec, size, float(len(audio)) / size, size * 8 / seconds / 1000, elapsed * 1000 / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+ Measure the latency of BingSpeechAPI against a local stub server
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import json
+import sys
+import threading
+import time
+
+try: # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError: # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from respeaker.bing_speech_api import BingSpeechAPI
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                body += self.rfile.read(size + 2)[:size]
+                if not size:
+                    return body
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        self.read_body()
+        if self.path.startswith('/issueToken'):
+            body = b'token'
+        elif self.path.startswith('/recognize'):
+            body = json.dumps({'header': {'lexical': 'hello'}}).encode()
+        else:
+            body = b'\0' * 32000
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    base = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    bing = BingSpeechAPI(key='key', pool_size=threads)
+    bing.token_url = base + '/issueToken'
+    bing.recognize_url = base + '/recognize'
+    bing.synthesize_url = base + '/synthesize'
+
+    audio = b'\0' * 32000
+    latencies = []
+    lock = threading.Lock()
+
+    def run():
+        for _ in range(number // threads):
+            start = time.time()
+            bing.recognize(audio)
+            with lock:
+                latencies.append(time.time() - start)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - start
+
+    print('{} recognitions from {} threads in {:.2f} s'.format(len(latencies), threads, elapsed))
+    print('p50 {:.1f} ms, p99 {:.1f} ms'.format(percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000))
+
+    bing.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
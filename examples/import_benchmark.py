@@ -0,0 +1,59 @@
+"""
+ Measure the time to import the library in a fresh interpreter
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import subprocess
+import sys
+import time
+
+
+STATEMENTS = [
+    ('interpreter only', 'pass'),
+    ('import respeaker', 'import respeaker'),
+    ('import BingSpeechAPI', 'from respeaker.bing_speech_api import BingSpeechAPI'),
+    # what `import respeaker` used to do: load PyAudio, enumerate USB and export GPIOs
+    ('eager (old behaviour)', 'import respeaker; respeaker.Microphone; respeaker.Player; '
+                              'respeaker.pixel_ring.get(); respeaker.spi.get()'),
+]
+
+
+def measure(statement, number=10):
+    times = []
+    for _ in range(number):
+        start = time.time()
+        returncode = subprocess.call([sys.executable, '-c', statement])
+        times.append(time.time() - start)
+        if returncode:
+            return None
+
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for name, statement in STATEMENTS:
+        median = measure(statement, number)
+        if median is None:
+            print('{:<24} failed'.format(name))
+        else:
+            print('{:<24} {:8.1f} ms'.format(name, median * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+ Measure CRC8, framing and SPI transfers of single and batched messages
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import os
+import sys
+import timeit
+
+from respeaker.spi import SPI, crc8, pack
+
+
+def measure(function, number):
+    return min(timeit.repeat(function, number=number, repeat=3)) / number
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    spi = SPI()
+
+    for size in (4, 16, 52):
+        data = bytearray(os.urandom(size))
+        print('crc8 {:>3} bytes           {:8.1f} us'.format(size, measure(lambda: crc8(data), number) * 1e6))
+        print('pack {:>3} bytes           {:8.1f} us'.format(size, measure(lambda: pack(0, data), number) * 1e6))
+
+    # a LED command and a spectrum of 16 bands, as sent by PixelRing and Player
+    messages = [(0, bytearray([6, 0, 0, 0]) + bytearray(48)), (0xA0, bytearray(16))]
+
+    def write():
+        for address, data in messages:
+            spi.write(data, address)
+
+    print('write x{}                {:8.1f} us'.format(len(messages), measure(write, number) * 1e6))
+    print('write_many x{}           {:8.1f} us'.format(len(messages), measure(lambda: spi.write_many(messages), number) * 1e6))
+
+    spi.close()
+
+
+if __name__ == '__main__':
+    main()
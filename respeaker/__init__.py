@@ -15,7 +15,35 @@
  limitations under the License.
 """
 
-from respeaker.microphone import Microphone
+import importlib
+import sys
+
 from respeaker.spi import SPI, spi
-from respeaker.player import Player
 from respeaker.pixel_ring import PixelRing, pixel_ring
+
+# Imported on first access, as they load PyAudio
+LAZY_ATTRIBUTES = {
+    'Microphone': 'respeaker.microphone',
+    'Player': 'respeaker.player',
+}
+
+__all__ = ['Microphone', 'SPI', 'spi', 'Player', 'PixelRing', 'pixel_ring']
+
+
+def __getattr__(name):
+    if name in LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(LAZY_ATTRIBUTES[name]), name)
+        globals()[name] = value
+        return value
+
+    raise AttributeError("module 'respeaker' has no attribute '{}'".format(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(LAZY_ATTRIBUTES))
+
+
+if sys.version_info < (3, 7):
+    # module __getattr__ is not supported
+    from respeaker.microphone import Microphone
+    from respeaker.player import Player
@@ -0,0 +1,215 @@
+"""
+ Asyncio interface of Microphone (Python 3.7+)
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import asyncio
+import logging
+
+from respeaker.audio_bus import DROP_OLDEST
+from respeaker.microphone import Microphone
+
+
+logger = logging.getLogger('mic')
+
+
+class AsyncSubscription(object):
+    """
+    Await the audio of an AudioBus subscription in an asyncio event loop
+
+    The audio thread only schedules a wakeup with loop.call_soon_threadsafe
+    when a coroutine is waiting, and the data is read in the event loop. The
+    loop is the running loop of the first read if None.
+    """
+
+    def __init__(self, subscription, loop=None):
+        self.subscription = subscription
+        self.loop = loop
+        self.waiter = None
+        subscription.callback = self._wake
+
+    def _wake(self):
+        # called by the audio thread
+        waiter = self.waiter
+        if waiter is not None:
+            self.loop.call_soon_threadsafe(self._set, waiter)
+
+    @staticmethod
+    def _set(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    async def read(self, timeout=None):
+        """
+        Read a frame, see Subscription.read
+
+        Returns:
+            bytes, empty on timeout or when closed
+        """
+        subscription = self.subscription
+        size = subscription.frame_bytes if subscription.frame_bytes else 1
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        while subscription.available() < size and not subscription.closed:
+            self.waiter = self.loop.create_future()
+            try:
+                if subscription.available() >= size or subscription.closed:
+                    break
+                await asyncio.wait_for(self.waiter, timeout)
+            except asyncio.TimeoutError:
+                return b''
+            finally:
+                self.waiter = None
+
+        return subscription.read(timeout=0)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self.read()
+        if not data:
+            raise StopAsyncIteration
+
+        return data
+
+
+class AsyncMicrophone(object):
+    """
+    Microphone for asyncio, so one event loop can serve the microphone, HTTP clients and LEDs without extra threads
+
+    The decoder may block (pocketsphinx, or a round trip to DecoderProcess),
+    so it runs in the default executor of the loop.
+    """
+
+    def __init__(self, microphone=None, **kwargs):
+        """
+
+        Args:
+            microphone: Microphone to use, a new one is created with kwargs if None
+        """
+        self.microphone = microphone if microphone else Microphone(**kwargs)
+
+    def subscribe(self, frame_bytes=None, policy=DROP_OLDEST, history=0):
+        """
+        Attach a consumer to the capture stream, see Microphone.subscribe
+
+        Returns:
+            AsyncSubscription, which supports `async for chunk in subscription`
+        """
+        subscription = self.microphone.subscribe(frame_bytes, policy, history)
+        return AsyncSubscription(subscription)
+
+    def unsubscribe(self, subscription):
+        self.microphone.unsubscribe(subscription.subscription)
+
+    async def detect(self, keyword=None):
+        mic = self.microphone
+        loop = asyncio.get_running_loop()
+        subscription = AsyncSubscription(mic._start_detect(), loop)
+        try:
+            while not mic.quit_event.is_set():
+                data = await subscription.read(timeout=1)
+                if not data:
+                    continue
+
+                result = await loop.run_in_executor(None, mic._spot, data, keyword, subscription.subscription)
+                if result:
+                    return result
+        finally:
+            mic.unsubscribe(subscription.subscription)
+
+    wakeup = detect
+
+    def listen(self, duration=9, timeout=3, vad=None):
+        """
+        Capture speech, use it as `async for chunk in mic.listen()`
+        """
+        mic = self.microphone
+        subscription, gate = mic._start_listen(duration, timeout, vad)
+        subscription = AsyncSubscription(subscription)
+
+        async def _listen():
+            try:
+                while not gate.done and not mic.quit_event.is_set():
+                    data = await subscription.read(timeout=timeout)
+                    if not data:
+                        break
+
+                    for d in gate.push(data):
+                        yield d
+            finally:
+                mic._stop_listen(subscription.subscription)
+
+        return _listen()
+
+    async def recognize(self, data):
+        """
+        Recognize audio of bytes, a generator or an async iterator such as listen()
+        """
+        loop = asyncio.get_running_loop()
+        if not hasattr(data, '__aiter__'):
+            return await loop.run_in_executor(None, self.microphone.recognize, data)
+
+        decoder = self.microphone.decoder
+        await loop.run_in_executor(None, self._restart, decoder)
+
+        async for d in data:
+            await loop.run_in_executor(None, decoder.process_raw, d, False, False)
+
+        hypothesis = await loop.run_in_executor(None, decoder.hyp)
+        if hypothesis:
+            logger.info('Recognized {}'.format(hypothesis.hypstr))
+            return hypothesis.hypstr
+
+        return ''
+
+    @staticmethod
+    def _restart(decoder):
+        decoder.end_utt()
+        decoder.start_utt()
+
+    def quit(self):
+        self.microphone.quit()
+
+    def close(self):
+        self.microphone.close()
+
+
+async def task(mic):
+    while not mic.microphone.quit_event.is_set():
+        if await mic.wakeup('respeaker'):
+            print('Wake up')
+            text = await mic.recognize(mic.listen())
+            if text:
+                print('Recognized %s' % text)
+
+
+def main():
+    logging.basicConfig(level=logging.DEBUG)
+
+    mic = AsyncMicrophone()
+    try:
+        asyncio.run(task(mic))
+    except KeyboardInterrupt:
+        print('Quit')
+    finally:
+        mic.close()
+
+
+if __name__ == '__main__':
+    main()
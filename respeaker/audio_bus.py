@@ -0,0 +1,185 @@
+"""
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import threading
+
+from respeaker.ring_buffer import RingBuffer
+
+DROP_OLDEST = 'drop-oldest'
+BLOCK = 'block'
+
+POLICIES = (DROP_OLDEST, BLOCK)
+
+
+class Subscription(object):
+    """
+    A consumer of an AudioBus with its own read cursor
+    """
+
+    def __init__(self, bus, frame_bytes=None, policy=DROP_OLDEST, history=0):
+        if policy not in POLICIES:
+            raise ValueError('%s policy is not supported' % policy)
+
+        self.bus = bus
+        self.frame_bytes = frame_bytes
+        self.policy = policy
+        self.cursor = bus.head - min(history, bus.size, bus.head)
+        self.overruns = 0
+        self.dropped = 0
+        self.closed = False
+        self.event = threading.Event()
+        self.space = threading.Event()
+        # called by the producer after new data is written, e.g. to wake an event loop
+        self.callback = None
+
+    def available(self):
+        return self.bus.head - self.cursor
+
+    def read(self, timeout=None):
+        """
+        Read a frame of frame_bytes, or all available data if frame_bytes is None
+
+        Args:
+            timeout: seconds to wait for data, None to wait until data arrives or the subscription is closed
+
+        Returns:
+            bytes, empty on timeout or when closed
+        """
+        bus = self.bus
+        size = self.frame_bytes if self.frame_bytes else 1
+        while True:
+            while bus.head - self.cursor < size and not self.closed:
+                self.event.clear()
+                if bus.head - self.cursor >= size or self.closed:
+                    break
+                if not self.event.wait(timeout):
+                    return b''
+
+            if self.closed:
+                return b''
+
+            lag = bus.head - self.cursor
+            if lag > bus.size:
+                # lapped by the producer, skip to the oldest complete frame still in the ring
+                skip = lag - bus.size
+                if self.frame_bytes:
+                    skip = (skip + self.frame_bytes - 1) // self.frame_bytes * self.frame_bytes
+                self.cursor += skip
+                self.overruns += 1
+                self.dropped += skip
+                continue
+
+            length = self.frame_bytes if self.frame_bytes else lag
+            data = bus.copy(self.cursor, length)
+            if bus.head - self.cursor > bus.size:
+                # overwritten while copying
+                continue
+
+            self.cursor += length
+            if self.policy == BLOCK:
+                self.space.set()
+
+            return data
+
+    def wake(self):
+        self.event.set()
+        if self.callback is not None:
+            self.callback()
+
+    def close(self):
+        self.closed = True
+        self.space.set()
+        self.wake()
+
+    def __iter__(self):
+        data = self.read()
+        while data:
+            yield data
+            data = self.read()
+
+
+class AudioBus(RingBuffer):
+    """
+    Fan out one audio stream to any number of consumers
+
+    The producer writes every chunk once into a shared ring, and each
+    Subscription reads it through its own cursor and frame size. A consumer
+    with the drop-oldest policy that falls behind by more than the ring size
+    skips the oldest audio. A consumer with the block policy makes the producer
+    wait for room, at most block_timeout seconds per write.
+    """
+
+    def __init__(self, size, block_timeout=0.01):
+        super(AudioBus, self).__init__(size)
+        self.block_timeout = block_timeout
+        self.subscriptions = ()
+        self.lock = threading.Lock()
+
+    def subscribe(self, frame_bytes=None, policy=DROP_OLDEST, history=0):
+        """
+        Add a consumer
+
+        Args:
+            frame_bytes: bytes returned by every read, None for all available data
+            policy: DROP_OLDEST or BLOCK, what to do when the consumer falls behind
+            history: bytes of already written audio the consumer starts with
+
+        Returns:
+            Subscription
+        """
+        subscription = Subscription(self, frame_bytes, policy, history)
+        with self.lock:
+            if self.closed:
+                subscription.close()
+            else:
+                self.subscriptions += (subscription,)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self.lock:
+            self.subscriptions = tuple(s for s in self.subscriptions if s is not subscription)
+
+    def write(self, data):
+        size = len(data)
+        subscriptions = self.subscriptions
+        for subscription in subscriptions:
+            if subscription.policy != BLOCK:
+                continue
+
+            while self.head + size - subscription.cursor > self.size and not subscription.closed:
+                subscription.space.clear()
+                if self.head + size - subscription.cursor <= self.size:
+                    break
+                if not subscription.space.wait(self.block_timeout):
+                    break
+
+        self._put(data)
+        for subscription in subscriptions:
+            subscription.wake()
+
+        return size
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            subscriptions = self.subscriptions
+            self.subscriptions = ()
+
+        for subscription in subscriptions:
+            subscription.close()
@@ -0,0 +1,356 @@
+"""
+ Incremental audio encoders for uploading speech
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import array
+import ctypes
+import ctypes.util
+import io
+import logging
+import os
+import sys
+import wave
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger('encoder')
+
+
+def load_library(names, name):
+    """
+    Load a shared library by one of its file names, or by the name given to ctypes.util.find_library
+    """
+    for n in names:
+        try:
+            return ctypes.CDLL(n)
+        except OSError:
+            pass
+
+    path = ctypes.util.find_library(name)
+    if path:
+        return ctypes.CDLL(path)
+
+    raise OSError('Can not find {} dynamic library'.format(name))
+
+
+class PCMEncoder(object):
+    """
+    16 bit PCM in a WAV container, which does not need any library
+
+    Every encoder turns 16 bit mono PCM into a byte stream chunk by chunk:
+    start() returns the header, encode() the bytes of a chunk (possibly empty
+    when the codec needs more samples) and finish() the remaining bytes.
+    """
+
+    codec = 'pcm'
+
+    def __init__(self, sample_rate=16000, bitrate=None):
+        self.sample_rate = sample_rate
+        self.content_type = 'audio/wav; samplerate={0}; sourcerate={0}; trustsourcerate=true'.format(sample_rate)
+
+    def start(self):
+        with io.BytesIO() as f:
+            w = wave.open(f, 'wb')
+            try:
+                w.setframerate(self.sample_rate)
+                w.setsampwidth(2)
+                w.setnchannels(1)
+                w.writeframes(b'')
+                header = f.getvalue()
+            finally:
+                w.close()
+        return header
+
+    def encode(self, data):
+        return data
+
+    def finish(self):
+        return b''
+
+    def close(self):
+        pass
+
+
+_FLAC_WRITE_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_ubyte), ctypes.c_size_t,
+                                        ctypes.c_uint32, ctypes.c_uint32, ctypes.c_void_p)
+
+_flac = None
+
+
+def _load_flac():
+    global _flac
+    if _flac is None:
+        if os.name == 'nt':
+            library = load_library(['libFLAC.dll', 'libFLAC-8.dll'], 'FLAC')
+        else:
+            library = load_library(['libFLAC.so', 'libFLAC.so.12', 'libFLAC.so.8'], 'FLAC')
+
+        library.FLAC__stream_encoder_new.restype = ctypes.c_void_p
+        library.FLAC__stream_encoder_delete.argtypes = (ctypes.c_void_p,)
+        for name in ('channels', 'bits_per_sample', 'sample_rate', 'compression_level', 'blocksize'):
+            function = getattr(library, 'FLAC__stream_encoder_set_' + name)
+            function.argtypes = (ctypes.c_void_p, ctypes.c_uint32)
+        library.FLAC__stream_encoder_init_stream.argtypes = (ctypes.c_void_p, _FLAC_WRITE_CALLBACK, ctypes.c_void_p,
+                                                             ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p)
+        library.FLAC__stream_encoder_process_interleaved.argtypes = (ctypes.c_void_p, ctypes.c_void_p,
+                                                                     ctypes.c_uint32)
+        library.FLAC__stream_encoder_finish.argtypes = (ctypes.c_void_p,)
+        _flac = library
+
+    return _flac
+
+
+def _to_int32(data):
+    if numpy is not None:
+        return numpy.frombuffer(data, dtype='<i2').astype(numpy.int32)
+
+    samples = array.array('h', bytes(data))
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return array.array('i', samples)
+
+
+class FLACEncoder(PCMEncoder):
+    """
+    Lossless FLAC through libFLAC, about half the size of PCM for speech
+
+    The stream has no seek table and no total number of samples, as it is
+    sent while the audio is captured. blocksize samples are buffered before a
+    frame is written.
+    """
+
+    codec = 'flac'
+
+    def __init__(self, sample_rate=16000, bitrate=None, compression_level=5, blocksize=1024):
+        self.sample_rate = sample_rate
+        self.content_type = 'audio/flac; rate={}'.format(sample_rate)
+        self.library = _load_flac()
+        self.output = []
+        # keep a reference, libFLAC calls it until the encoder is deleted
+        self.write_callback = _FLAC_WRITE_CALLBACK(self._write)
+
+        self.encoder = self.library.FLAC__stream_encoder_new()
+        if not self.encoder:
+            raise MemoryError('Failed to create FLAC encoder')
+
+        library = self.library
+        library.FLAC__stream_encoder_set_channels(self.encoder, 1)
+        library.FLAC__stream_encoder_set_bits_per_sample(self.encoder, 16)
+        library.FLAC__stream_encoder_set_sample_rate(self.encoder, sample_rate)
+        library.FLAC__stream_encoder_set_compression_level(self.encoder, compression_level)
+        library.FLAC__stream_encoder_set_blocksize(self.encoder, blocksize)
+
+        # initialized here, so create_encoder() falls back to PCM when it fails
+        status = library.FLAC__stream_encoder_init_stream(self.encoder, self.write_callback, None, None, None, None)
+        if status != 0:
+            self.close()
+            raise RuntimeError('Failed to initialize FLAC encoder, status {}'.format(status))
+
+    def _write(self, encoder, buffer, size, samples, frame, client_data):
+        self.output.append(ctypes.string_at(buffer, size))
+        return 0
+
+    def _take(self):
+        data = b''.join(self.output)
+        self.output = []
+        return data
+
+    def start(self):
+        # the stream header written by the initialization
+        return self._take()
+
+    def encode(self, data):
+        samples = _to_int32(data)
+        if numpy is not None:
+            pointer = samples.ctypes.data
+        else:
+            pointer = samples.buffer_info()[0]
+
+        if not self.library.FLAC__stream_encoder_process_interleaved(self.encoder, pointer, len(samples)):
+            raise RuntimeError('Failed to encode FLAC')
+
+        return self._take()
+
+    def finish(self):
+        self.library.FLAC__stream_encoder_finish(self.encoder)
+        return self._take()
+
+    def close(self):
+        if self.encoder:
+            self.library.FLAC__stream_encoder_delete(self.encoder)
+            self.encoder = None
+
+
+_OPUS_WRITE_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_ubyte), ctypes.c_int32)
+_OPUS_CLOSE_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p)
+
+
+class _OpusCallbacks(ctypes.Structure):
+    _fields_ = [
+        ('write', _OPUS_WRITE_CALLBACK),
+        ('close', _OPUS_CLOSE_CALLBACK),
+    ]
+
+
+OPUS_SET_BITRATE_REQUEST = 4002
+OPE_SET_DECISION_DELAY_REQUEST = 14000
+OPE_SET_MUXING_DELAY_REQUEST = 14002
+
+_opusenc = None
+
+
+def _load_opusenc():
+    global _opusenc
+    if _opusenc is None:
+        if os.name == 'nt':
+            library = load_library(['libopusenc.dll', 'libopusenc-0.dll'], 'opusenc')
+        else:
+            library = load_library(['libopusenc.so', 'libopusenc.so.0'], 'opusenc')
+
+        library.ope_comments_create.restype = ctypes.c_void_p
+        library.ope_comments_destroy.argtypes = (ctypes.c_void_p,)
+        library.ope_encoder_create_callbacks.restype = ctypes.c_void_p
+        library.ope_encoder_create_callbacks.argtypes = (ctypes.POINTER(_OpusCallbacks), ctypes.c_void_p,
+                                                         ctypes.c_void_p, ctypes.c_int32, ctypes.c_int, ctypes.c_int,
+                                                         ctypes.POINTER(ctypes.c_int))
+        library.ope_encoder_write.argtypes = (ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int)
+        library.ope_encoder_flush_header.argtypes = (ctypes.c_void_p,)
+        library.ope_encoder_drain.argtypes = (ctypes.c_void_p,)
+        library.ope_encoder_destroy.argtypes = (ctypes.c_void_p,)
+        _opusenc = library
+
+    return _opusenc
+
+
+class OpusEncoder(PCMEncoder):
+    """
+    Ogg Opus through libopusenc, 16 - 32 kbit/s is enough for speech recognition
+
+    Pages are written at least every muxing_delay seconds, so the audio is
+    sent while it is captured.
+    """
+
+    codec = 'opus'
+
+    def __init__(self, sample_rate=16000, bitrate=24000, muxing_delay=0.1):
+        self.sample_rate = sample_rate
+        self.content_type = 'audio/ogg; codecs=opus'
+        self.library = _load_opusenc()
+        self.output = []
+        self.callbacks = _OpusCallbacks(_OPUS_WRITE_CALLBACK(self._write), _OPUS_CLOSE_CALLBACK(lambda user: 0))
+
+        library = self.library
+        self.comments = library.ope_comments_create()
+        error = ctypes.c_int(0)
+        self.encoder = library.ope_encoder_create_callbacks(ctypes.byref(self.callbacks), None, self.comments,
+                                                            sample_rate, 1, 0, ctypes.byref(error))
+        if not self.encoder:
+            library.ope_comments_destroy(self.comments)
+            raise RuntimeError('Failed to create Opus encoder, error {}'.format(error.value))
+
+        if bitrate:
+            library.ope_encoder_ctl(ctypes.c_void_p(self.encoder), OPUS_SET_BITRATE_REQUEST, ctypes.c_int32(bitrate))
+        # in samples at 48 kHz, the lookahead of the encoder must not hold back the pages either
+        delay = ctypes.c_int32(int(muxing_delay * 48000))
+        library.ope_encoder_ctl(ctypes.c_void_p(self.encoder), OPE_SET_DECISION_DELAY_REQUEST, delay)
+        library.ope_encoder_ctl(ctypes.c_void_p(self.encoder), OPE_SET_MUXING_DELAY_REQUEST, delay)
+
+    def _write(self, user_data, buffer, size):
+        self.output.append(ctypes.string_at(buffer, size))
+        return 0
+
+    def _take(self):
+        data = b''.join(self.output)
+        self.output = []
+        return data
+
+    def start(self):
+        self.library.ope_encoder_flush_header(self.encoder)
+        return self._take()
+
+    def encode(self, data):
+        data = bytes(data)
+        if sys.byteorder == 'big':
+            samples = array.array('h', data)
+            samples.byteswap()
+            data = samples.tostring() if hasattr(samples, 'tostring') else samples.tobytes()
+
+        if self.library.ope_encoder_write(self.encoder, data, len(data) // 2) != 0:
+            raise RuntimeError('Failed to encode Opus')
+
+        return self._take()
+
+    def finish(self):
+        self.library.ope_encoder_drain(self.encoder)
+        return self._take()
+
+    def close(self):
+        if self.encoder:
+            self.library.ope_encoder_destroy(self.encoder)
+            self.library.ope_comments_destroy(self.comments)
+            self.encoder = None
+
+
+ENCODERS = {
+    'pcm': PCMEncoder,
+    'flac': FLACEncoder,
+    'opus': OpusEncoder,
+}
+
+
+def create_encoder(codec='pcm', sample_rate=16000, bitrate=None):
+    """
+    Create an encoder, or a PCMEncoder when the library of the codec is not available
+
+    Args:
+        codec: 'pcm', 'flac' or 'opus'
+        sample_rate: sample rate of the audio
+        bitrate: target bits per second of lossy codecs, the default of the codec if None
+    """
+    if codec not in ENCODERS:
+        raise ValueError('{} codec is not supported'.format(codec))
+
+    kwargs = {'bitrate': bitrate} if bitrate else {}
+    try:
+        return ENCODERS[codec](sample_rate, **kwargs)
+    except (OSError, AttributeError, RuntimeError) as e:
+        logger.info('Can not use {}, use PCM instead - {}'.format(codec, e))
+        return PCMEncoder(sample_rate)
+
+
+def encode(chunks, encoder):
+    """
+    Encode chunks of 16 bit mono PCM as they arrive
+
+    Returns:
+        generator of the encoded bytes
+    """
+    try:
+        yield encoder.start()
+        for data in chunks:
+            output = encoder.encode(data)
+            if output:
+                yield output
+        output = encoder.finish()
+        if output:
+            yield output
+    finally:
+        encoder.close()
@@ -18,12 +18,27 @@
 """
 
 import io
+import logging
 import os
+import threading
 import types
 import uuid
 import wave
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from respeaker.audio_encoder import create_encoder, encode
+
+try:
+    from urllib3.util.retry import Retry
+except ImportError:
+    from requests.packages.urllib3.util.retry import Retry
+
+try: # Python 3, or the futures package on Python 2
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
 
 try: # Python 2 and Python <= 3.2
     from monotonic import monotonic
@@ -31,15 +46,61 @@ except: # Python >= 3.3
     from time import monotonic
 
 
+logger = logging.getLogger('bing')
+
+
 class RequestError(Exception):
     pass
 
 
+def create_retry(retries):
+    # only failed connections are retried, as the body of a streaming request can not be sent again
+    options = dict(total=retries, connect=retries, read=0, backoff_factor=0.1)
+    try:
+        return Retry(allowed_methods=frozenset(['GET', 'POST']), **options)
+    except TypeError: # urllib3 < 1.26
+        return Retry(method_whitelist=frozenset(['GET', 'POST']), **options)
+
+
 class BingSpeechAPI:
-    def __init__(self, key=os.getenv('BING_KEY', '')):
+    """
+    Client of Bing Speech, it can be shared by threads
+
+    The access token is refreshed by a background thread before it expires,
+    so recognize() and synthesize() do not wait for it. Connections are kept
+    alive in a pool of pool_size connections per host.
+    """
+
+    token_url = "https://api.cognitive.microsoft.com/sts/v1.0/issueToken"
+    recognize_url = "https://speech.platform.bing.com/recognize/query"
+    synthesize_url = "https://speech.platform.bing.com/synthesize"
+
+    # document mentions the access token is expired in 10 minutes
+    expiry_seconds = 590
+    # seconds before the expiry to get a new token
+    refresh_margin = 60
+
+    def __init__(self, key=os.getenv('BING_KEY', ''), pool_size=8, retries=2, timeout=(3.05, 30)):
+        """
+
+        Args:
+            key: subscription key
+            pool_size: max connections kept alive per host
+            retries: times to retry a request which fails to connect
+            timeout: (connect, read) timeout in seconds of every request
+        """
         self.key = key
         self.access_token = None
         self.expire_time = None
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # serializes token requests, never held with lock
+        self.refresh_lock = threading.Lock()
+        self.refresh_event = threading.Event()
+        self.refresh_thread = None
+        self.closed = False
+        self.pool_size = pool_size
+        self.executor = None
         self.locales = {
             "ar-eg": {"Female": "Microsoft Server Speech Text to Speech Voice (ar-EG, Hoda)"},
             "de-DE": {"Female": "Microsoft Server Speech Text to Speech Voice (de-DE, Hedda)",
@@ -74,55 +135,144 @@ class BingSpeechAPI:
         }
 
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=create_retry(retries))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # parts of the requests which do not change
+        self.instance_id = str(uuid.uuid4())
+        self.client_id = uuid.uuid1().hex
+        self.recognize_params = {
+            "version": "3.0",
+            "appID": "D4D52672-91D7-4C74-8AD8-42B1D98141A5",
+            "format": "json",
+            "device.os": "wp7",
+            "scenarios": "ulm",
+            "instanceid": self.instance_id,
+            "result.profanitymarkup": "0",
+        }
+        self.synthesize_headers = {
+            "Content-type": "application/ssml+xml",
+            "X-Microsoft-OutputFormat": "raw-16khz-16bit-mono-pcm",
+            "X-Search-AppId": "07D3234E49CE426DAA29772419F436CA",
+            "X-Search-ClientID": self.client_id,
+            "User-Agent": "TTSForPython"
+        }
 
     def authenticate(self):
-        if self.expire_time is None or monotonic() > self.expire_time:  # first credential request, or the access token from the previous one expired
-            # get an access token using OAuth
-            credential_url = "https://api.cognitive.microsoft.com/sts/v1.0/issueToken"
-            headers = {"Ocp-Apim-Subscription-Key": self.key}
+        """
+        Get an access token if there is no valid one, and start refreshing it in the background
+        """
+        if self.expire_time is None or monotonic() >= self.expire_time:
+            with self.refresh_lock:
+                # first credential request, or the access token from the previous one expired
+                if self.expire_time is None or monotonic() >= self.expire_time:
+                    self._refresh()
+
+        if self.refresh_thread is None:
+            with self.lock:
+                if self.refresh_thread is None and not self.closed:
+                    self.refresh_thread = threading.Thread(target=self._refresh_loop)
+                    self.refresh_thread.daemon = True
+                    self.refresh_thread.start()
+
+    def _refresh(self):
+        # get an access token using OAuth
+        headers = {"Ocp-Apim-Subscription-Key": self.key}
+
+        start_time = monotonic()
+        response = self.session.post(self.token_url, headers=headers, timeout=self.timeout)
 
-            start_time = monotonic()
-            response = self.session.post(credential_url, headers=headers)
+        if response.status_code != 200:
+            raise RequestError("http request error with status code {}".format(response.status_code))
 
-            if response.status_code != 200:
-                raise RequestError("http request error with status code {}".format(response.status_code))
+        # the request is not made under the lock, so it does not block recognize_stream()
+        with self.lock:
+            self.access_token = response.text
+            self.expire_time = start_time + self.expiry_seconds
 
-            self.access_token = response.content
-            expiry_seconds = 590 # document mentions the access token is expired in 10 minutes
+    def _refresh_loop(self):
+        delay = self.expire_time - self.refresh_margin - monotonic()
+        while not self.refresh_event.wait(max(delay, 0)):
+            try:
+                with self.refresh_lock:
+                    self._refresh()
+                delay = self.expire_time - self.refresh_margin - monotonic()
+            except (RequestError, requests.RequestException) as e:
+                logger.warning('Failed to refresh the access token - {}'.format(e))
+                delay = min(10, max(self.expire_time - monotonic(), 1))
+
+    def close(self):
+        self.closed = True
+        self.refresh_event.set()
+        if self.refresh_thread is not None:
+            self.refresh_thread.join()
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.session.close()
+
+    def recognize_stream(self, audio, language="en-US", show_all=False, codec="pcm", bitrate=None):
+        """
+        Upload audio while it is captured, e.g. `bing.recognize_stream(mic.listen()).result()`
+
+        The request is sent when the first chunk arrives, which is the speech
+        onset for Microphone.listen(), and every chunk is sent with chunked
+        transfer encoding as soon as it is captured, so the upload overlaps
+        with the speech.
+
+        Returns:
+            concurrent.futures.Future of the result of recognize(), '' if there is no audio
+        """
+        with self.lock:
+            if self.executor is None:
+                if ThreadPoolExecutor is None:
+                    raise RuntimeError('concurrent.futures is required, install futures on Python 2')
+                self.executor = ThreadPoolExecutor(max_workers=self.pool_size)
+
+        return self.executor.submit(self._recognize_stream, iter(audio), language, show_all, codec, bitrate)
+
+    def _recognize_stream(self, audio, language, show_all, codec, bitrate):
+        # get a token while waiting for the speech onset
+        self.authenticate()
+        first = next(audio, None)
+        if first is None:
+            return {} if show_all else ''
+
+        def generate():
+            yield first
+            for data in audio:
+                yield data
+
+        return self.recognize(generate(), language, show_all, codec, bitrate)
 
-            self.expire_time = start_time + expiry_seconds
+    def recognize(self, audio_data, language="en-US", show_all=False, codec="pcm", bitrate=None):
+        """
+        Recognize 16 bit mono PCM of bytes or a generator
 
-    def recognize(self, audio_data, language="en-US", show_all=False):
+        Args:
+            codec: 'pcm', 'flac' or 'opus', the audio is encoded chunk by chunk before it is sent
+            bitrate: bits per second of a lossy codec, the default of the codec if None
+        """
         self.authenticate()
+        encoder = create_encoder(codec, bitrate=bitrate)
         if isinstance(audio_data, types.GeneratorType):
-            def generate(audio):
-                yield self.get_wav_header()
-                for a in audio:
-                    yield a
-
-            data = generate(audio_data)
-        else:
+            data = encode(audio_data, encoder)
+        elif encoder.codec == 'pcm':
             data = self.to_wav(audio_data)
+        else:
+            data = b''.join(encode([audio_data], encoder))
 
-        params = {
-            "version": "3.0",
-            "requestid": uuid.uuid4(),
-            "appID": "D4D52672-91D7-4C74-8AD8-42B1D98141A5",
-            "format": "json",
-            "locale": language,
-            "device.os": "wp7",
-            "scenarios": "ulm",
-            "instanceid": uuid.uuid4(),
-            "result.profanitymarkup": "0",
-        }
+        params = dict(self.recognize_params)
+        params["requestid"] = str(uuid.uuid4())
+        params["locale"] = language
 
         headers = {
-            "Authorization": "Bearer {0}".format(self.access_token),
-            "Content-Type": "audio/wav; samplerate=16000; sourcerate=16000; trustsourcerate=true",
+            "Authorization": "Bearer " + self.access_token,
+            "Content-Type": encoder.content_type,
         }
 
-        url = "https://speech.platform.bing.com/recognize/query"
-        response = self.session.post(url, params=params, headers=headers, data=data)
+        response = self.session.post(self.recognize_url, params=params, headers=headers, data=data,
+                                     timeout=self.timeout)
 
         if response.status_code != 200:
             raise RequestError("http request error with status code {}".format(response.status_code))
@@ -147,7 +297,7 @@ class BingSpeechAPI:
             gender = "Female"
 
         if len(lang) == 1:
-            gender = lang.keys()[0]
+            gender = list(lang.keys())[0]
 
         service_name = lang[gender]
 
@@ -155,17 +305,11 @@ class BingSpeechAPI:
                 <voice xml:lang='%s' xml:gender='%s' name='%s'>%s</voice>\
                 </speak>" % (language, gender, service_name, text)
 
-        headers = {
-            "Content-type": "application/ssml+xml",
-            "X-Microsoft-OutputFormat": "raw-16khz-16bit-mono-pcm",
-            "Authorization": "Bearer " + self.access_token,
-            "X-Search-AppId": "07D3234E49CE426DAA29772419F436CA",
-            "X-Search-ClientID": str(uuid.uuid1()).replace('-', ''),
-            "User-Agent": "TTSForPython"
-        }
+        headers = dict(self.synthesize_headers)
+        headers["Authorization"] = "Bearer " + self.access_token
 
-        url = "https://speech.platform.bing.com/synthesize"
-        response = self.session.post(url, headers=headers, data=body, stream=stream)
+        response = self.session.post(self.synthesize_url, headers=headers, data=body, stream=stream,
+                                     timeout=self.timeout)
         if stream:
             data = response.iter_content(chunk_size=chunk_size)
         else:
@@ -197,7 +341,7 @@ class BingSpeechAPI:
                 w.setframerate(16000)
                 w.setsampwidth(2)
                 w.setnchannels(1)
-                w.writeframes('')
+                w.writeframes(b'')
                 header = f.getvalue()
             finally:
                 w.close()
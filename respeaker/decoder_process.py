@@ -0,0 +1,137 @@
+"""
+ Run a pocketsphinx decoder in a worker process
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import collections
+import ctypes
+import multiprocessing
+
+Hypothesis = collections.namedtuple('Hypothesis', ['hypstr'])
+
+
+def _copy(buffer, size, position, length):
+    start = position % size
+    first = min(length, size - start)
+    if first < length:
+        return buffer[start:size] + buffer[:length - first]
+
+    return buffer[start:start + length]
+
+
+def _serve(connection, buffer, size, consumed, create_decoder):
+    decoder = create_decoder()
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+
+        command = message[0]
+        if command == 'audio':
+            _, position, length, no_search, full_utt = message
+            data = _copy(buffer, size, position, length)
+            consumed.value = position + length
+            decoder.process_raw(data, no_search, full_utt)
+        elif command == 'raw':
+            _, data, no_search, full_utt = message
+            decoder.process_raw(data, no_search, full_utt)
+        elif command == 'start_utt':
+            decoder.start_utt()
+        elif command == 'end_utt':
+            decoder.end_utt()
+        elif command == 'hyp':
+            hypothesis = decoder.hyp()
+            connection.send(hypothesis.hypstr if hypothesis else None)
+        elif command == 'close':
+            break
+
+    connection.close()
+
+
+class DecoderProcess(object):
+    """
+    A pocketsphinx Decoder running in a separate process
+
+    It has the part of the Decoder API used by Microphone (start_utt, end_utt,
+    process_raw and hyp), so keyword spotting uses another core and does not
+    compete for the GIL with VAD or the spectrum thread. Audio goes through a
+    shared memory ring and only its position is sent over the pipe. hyp() waits
+    until all audio sent before it has been decoded.
+    """
+
+    def __init__(self, create_decoder, size=64 * 1024):
+        """
+
+        Args:
+            create_decoder: function which returns a Decoder, called in the worker process
+            size: bytes of the shared audio ring
+        """
+        self.size = size
+        self.buffer = multiprocessing.RawArray(ctypes.c_char, size)
+        self.consumed = multiprocessing.RawValue(ctypes.c_longlong, 0)
+        self.position = 0
+
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve,
+                                               args=(child, self.buffer, size, self.consumed, create_decoder))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+    def start_utt(self):
+        self.connection.send(('start_utt',))
+
+    def end_utt(self):
+        self.connection.send(('end_utt',))
+
+    def process_raw(self, data, no_search=False, full_utt=False):
+        if not isinstance(data, bytes):
+            data = bytes(data)
+
+        length = len(data)
+        if length > self.size:
+            self.connection.send(('raw', data, no_search, full_utt))
+            return
+
+        if self.position + length - self.consumed.value > self.size:
+            # wait until the worker catches up
+            self.hyp()
+
+        start = self.position % self.size
+        first = min(length, self.size - start)
+        address = ctypes.addressof(self.buffer)
+        ctypes.memmove(address + start, data, first)
+        if first < length:
+            ctypes.memmove(address, data[first:], length - first)
+
+        self.connection.send(('audio', self.position, length, no_search, full_utt))
+        self.position += length
+
+    def hyp(self):
+        self.connection.send(('hyp',))
+        hypstr = self.connection.recv()
+        return Hypothesis(hypstr) if hypstr is not None else None
+
+    def close(self):
+        try:
+            self.connection.send(('close',))
+        except (IOError, OSError):
+            pass
+        self.process.join(1)
+        self.connection.close()
@@ -0,0 +1,225 @@
+"""
+ Cache of audio and USB HID devices, refreshed on hotplug
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import logging
+import os
+import re
+import socket
+import threading
+import weakref
+
+try: # Python 2 and Python <= 3.2
+    from monotonic import monotonic
+except: # Python >= 3.3
+    from time import monotonic
+
+import respeaker.usb_hid
+
+
+logger = logging.getLogger('registry')
+
+NETLINK_KOBJECT_UEVENT = 15
+SUBSYSTEMS = (b'usb', b'sound', b'hidraw')
+ACTIONS = (b'add', b'remove')
+
+SYSFS = '/sys'
+
+
+def open_uevent_socket():
+    """
+    returns a netlink socket receiving kernel uevents, or None if it is not supported
+    """
+    if not hasattr(socket, 'AF_NETLINK'):
+        return None
+
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_KOBJECT_UEVENT)
+        sock.bind((0, 1))
+    except (IOError, OSError) as e:
+        logger.debug('Can not listen to uevents - {}'.format(e))
+        return None
+
+    return sock
+
+
+def is_hotplug(uevent):
+    """
+    uevent: b'add@/devices/...\\0ACTION=add\\0DEVPATH=...\\0SUBSYSTEM=usb\\0...'
+    """
+    fields = uevent.split(b'\0')
+    properties = dict(f.split(b'=', 1) for f in fields[1:] if b'=' in f)
+    return properties.get(b'ACTION') in ACTIONS and properties.get(b'SUBSYSTEM') in SUBSYSTEMS
+
+
+def _usb_address_of_sysfs(path):
+    # walk up from a sysfs device to the USB device, which has busnum and devnum
+    path = os.path.realpath(path)
+    while path.startswith(SYSFS + '/devices/'):
+        try:
+            with open(os.path.join(path, 'busnum')) as f:
+                bus = int(f.read())
+            with open(os.path.join(path, 'devnum')) as f:
+                address = int(f.read())
+            return bus, address
+        except (IOError, OSError, ValueError):
+            path = os.path.dirname(path)
+
+    return None
+
+
+def usb_address_of_audio_device(info):
+    """
+    returns (bus, address) of the USB device of a PortAudio device info, or None if it is unknown
+
+    The ALSA card is taken from the "(hw:card,device)" suffix of the name, which ALSA devices have.
+    """
+    match = re.search(r'\(hw:(\d+),\d+\)', info['name'])
+    if not match:
+        return None
+
+    return _usb_address_of_sysfs(os.path.join(SYSFS, 'class', 'sound', 'card' + match.group(1), 'device'))
+
+
+def usb_address_of_hid(interface):
+    """
+    returns (bus, address) of the USB device of a HID interface, or None if it is unknown
+    """
+    path = interface.path
+    if isinstance(path, bytes):
+        path = path.decode('utf-8', 'replace')
+
+    # PyUSB: bus-address
+    match = re.match(r'^(\d+)-(\d+)$', path)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+
+    # hidapi with libusb: bus:address:interface in hex
+    match = re.match(r'^([0-9a-fA-F]{4}):([0-9a-fA-F]{4}):[0-9a-fA-F]+$', path)
+    if match:
+        return int(match.group(1), 16), int(match.group(2), 16)
+
+    # hidapi with hidraw: /dev/hidrawN
+    if path.startswith('/dev/hidraw'):
+        return _usb_address_of_sysfs(os.path.join(SYSFS, 'class', 'hidraw', os.path.basename(path), 'device'))
+
+    return None
+
+
+class DeviceRegistry(object):
+    """
+    Cache PortAudio input devices and USB HID interfaces
+
+    Enumeration results are reused until a USB or sound hotplug uevent arrives
+    on a netlink socket. Where uevents are not available, the cache expires
+    every poll_interval seconds. HID interfaces which are still connected are
+    kept open across refreshes, and the ones which disappeared are closed.
+
+    PortAudio only sees devices present when the PyAudio instance was created,
+    so create a new PyAudio instance after a hotplug to use a new array.
+    """
+
+    def __init__(self, poll_interval=10):
+        self.poll_interval = poll_interval
+        self.lock = threading.RLock()
+        self.generation = 0
+        self.hids = []
+        self.hid_generation = None
+        # PyAudio instance -> (generation, devices), an entry goes away with its instance
+        self.audio = weakref.WeakKeyDictionary()
+        self.monitor = None
+        self.monitored = False
+        self.refresh_time = monotonic()
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+
+    def hid_interfaces(self):
+        """
+        returns the connected USB HID interfaces of ReSpeaker
+        """
+        with self.lock:
+            self._check()
+            if self.hid_generation != self.generation:
+                interfaces = respeaker.usb_hid.scan(self.hids)
+                for interface in self.hids:
+                    if interface not in interfaces:
+                        logger.info('{} is disconnected'.format(interface.getKey()))
+                        try:
+                            interface.close()
+                        except Exception as e:
+                            logger.debug('Failed to close {} - {}'.format(interface.getKey(), e))
+
+                self.hids = interfaces
+                self.hid_generation = self.generation
+
+            return list(self.hids)
+
+    def audio_devices(self, pyaudio_instance):
+        """
+        returns the info dicts of the input devices of pyaudio_instance
+        """
+        with self.lock:
+            self._check()
+            generation, devices = self.audio.get(pyaudio_instance, (None, None))
+            if generation != self.generation:
+                devices = []
+                for i in range(pyaudio_instance.get_device_count()):
+                    dev = pyaudio_instance.get_device_info_by_index(i)
+                    if dev['maxInputChannels'] > 0:
+                        devices.append(dev)
+
+                self.audio[pyaudio_instance] = (self.generation, devices)
+
+            return list(devices)
+
+    def _check(self):
+        if self.monitor is None:
+            self.start()
+
+        if not self.monitored and monotonic() - self.refresh_time > self.poll_interval:
+            self.refresh_time = monotonic()
+            self.generation += 1
+
+    def start(self):
+        """
+        Start watching hotplug events, called on first use
+        """
+        sock = open_uevent_socket()
+        self.monitored = sock is not None
+        self.monitor = threading.Thread(target=self._monitor, args=(sock,))
+        self.monitor.daemon = True
+        if sock is not None:
+            self.monitor.start()
+
+    def _monitor(self, sock):
+        while True:
+            try:
+                uevent = sock.recv(65536)
+            except (IOError, OSError) as e:
+                logger.warning('Stop watching uevents - {}'.format(e))
+                self.monitored = False
+                break
+
+            if is_hotplug(uevent):
+                logger.debug(uevent.split(b'\0')[0])
+                self.invalidate()
+
+
+registry = DeviceRegistry()
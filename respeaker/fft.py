@@ -21,15 +21,31 @@ import math
 import os
 import logging
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class FFT:
     def __init__(self, size):
         self.size = 1 << (size - 1).bit_length()
-
-        self.real_input = array.array('f', [0.0] * self.size)
-        self.complex_output = array.array('f', [0.0] * (self.size * 2))
-        self.amplitude = array.array('f', [0.0] * (self.size / 2 + 1))
-        self.phase = array.array('f', [0.0] * (self.size / 2 + 1))
+        self.bins = self.size // 2 + 1
+
+        if numpy is not None:
+            self.real_input = numpy.zeros(self.size, dtype=numpy.float32)
+            self.complex_output = numpy.zeros(self.bins, dtype=numpy.complex64)
+            self.amplitude = numpy.zeros(self.bins, dtype=numpy.float32)
+            self.phase = numpy.zeros(self.bins, dtype=numpy.float32)
+            input_ptr = self.real_input.ctypes.data
+            output_ptr = self.complex_output.ctypes.data
+        else:
+            self.real_input = array.array('f', [0.0] * self.size)
+            self.complex_output = array.array('f', [0.0] * (self.bins * 2))
+            self.amplitude = array.array('f', [0.0] * self.bins)
+            self.phase = array.array('f', [0.0] * self.bins)
+            input_ptr, _ = self.real_input.buffer_info()
+            output_ptr, _ = self.complex_output.buffer_info()
 
         try:
             if os.name == "nt":
@@ -47,30 +63,139 @@ class FFT:
             self.fftwf_execute.argtypes = (ctypes.c_void_p,)
             self.fftwf_execute.restype = None
 
-            input_ptr, _ = self.real_input.buffer_info()
-            output_ptr, _ = self.complex_output.buffer_info()
             self.fftwf_plan = self.fftwf_plan_dft_r2c_1d(self.size, input_ptr, output_ptr, 1)
         except Exception as e:
-            logging.warn('Can not find libffw3f dynamic library, return error - {}'.format(e.message))
-            self.fftwf_execute = lambda x: None
+            self.fftw3f = None
             self.fftwf_plan = None
+            if numpy is not None:
+                logging.info('Can not find libfftw3f dynamic library, use numpy.fft instead - {}'.format(e))
+                self.fftwf_execute = self._numpy_execute
+            else:
+                logging.warn('Can not find libfftw3f dynamic library, return error - {}'.format(e))
+                self.fftwf_execute = lambda x: None
+
+    def _numpy_execute(self, plan):
+        self.complex_output[:] = numpy.fft.rfft(self.real_input)
 
-    def dft(self, data, typecode='h'):
-        if type(data) is str:
-            a = array.array(typecode, data)
-            for index, value in enumerate(a):
-                self.real_input[index] = float(value)
-        elif type(data) is array.array:
-            for index, value in enumerate(data):
-                self.real_input[index] = float(value)
+    def dft(self, data, typecode='h', phase=False):
+        """
+        Compute the spectrum of one frame
+
+        Args:
+            data: audio samples, str/bytes (decoded with typecode), array.array or numpy array
+            typecode: sample format of str/bytes data, 'h' for S16_LE
+            phase: if true, return the phase of each bin as well
+
+        Returns:
+            amplitude, or (amplitude, phase) when phase is true
+        """
+        if numpy is not None:
+            return self._dft_numpy(data, typecode, phase)
+
+        if isinstance(data, (bytes, bytearray)):
+            data = array.array(typecode, data)
+        size = min(len(data), self.size)
+        self.real_input[:size] = array.array('f', data[:size])
+        self.real_input[size:] = array.array('f', [0.0]) * (self.size - size)
 
         self.fftwf_execute(self.fftwf_plan)
 
-        for i in range(len(self.amplitude)):
-            self.amplitude[i] = math.hypot(self.complex_output[i * 2], self.complex_output[i * 2 + 1])
-            # self.phase[i] = math.atan2(self.complex_output[i * 2 + 1], self.complex_output[i * 2])
+        real = self.complex_output[0::2]
+        imag = self.complex_output[1::2]
+        self.amplitude[:] = array.array('f', map(math.hypot, real, imag))
+        if phase:
+            self.phase[:] = array.array('f', map(math.atan2, imag, real))
+            return self.amplitude, self.phase
+
+        return self.amplitude
+
+    def _dft_numpy(self, data, typecode, phase):
+        if isinstance(data, array.array):
+            samples = numpy.frombuffer(data, dtype=data.typecode)
+        elif isinstance(data, numpy.ndarray):
+            samples = data
+        else:
+            samples = numpy.frombuffer(data, dtype=typecode)
+
+        size = min(len(samples), self.size)
+        self.real_input[:size] = samples[:size]
+        self.real_input[size:] = 0
+
+        self.fftwf_execute(self.fftwf_plan)
 
-        return self.amplitude  # , self.phase
+        numpy.absolute(self.complex_output, out=self.amplitude)
+        if phase:
+            numpy.arctan2(self.complex_output.imag, self.complex_output.real, out=self.phase)
+            return self.amplitude, self.phase
+
+        return self.amplitude
+
+    def dft_many(self, data, hop=None, window=None, typecode='h', phase=False):
+        """
+        Compute the spectra of all frames of a long buffer in one batch (short-time Fourier transform)
+
+        Args:
+            data: audio samples, str/bytes (decoded with typecode), array.array or numpy array
+            hop: samples between the starts of two adjacent frames, half of the FFT size by default
+            window: window function applied to every frame, None, 'hann', 'hamming', 'blackman' or an array
+            typecode: sample format of str/bytes data, 'h' for S16_LE
+            phase: if true, return the phase of each bin as well
+
+        Returns:
+            frames x bins amplitude matrix, or (amplitude, phase) when phase is true
+        """
+        if numpy is None:
+            raise ImportError('numpy is required by dft_many')
+
+        if isinstance(data, array.array):
+            samples = numpy.frombuffer(data, dtype=data.typecode)
+        elif isinstance(data, numpy.ndarray):
+            samples = data
+        else:
+            samples = numpy.frombuffer(data, dtype=typecode)
+
+        hop = hop if hop else self.size // 2
+        frames = 1 + (len(samples) - self.size) // hop if len(samples) >= self.size else 0
+
+        # every row is a view of the original buffer, no copy until the float conversion
+        view = numpy.lib.stride_tricks.as_strided(samples, shape=(frames, self.size),
+                                                  strides=(samples.strides[0] * hop, samples.strides[0]),
+                                                  writeable=False)
+        frames = view.astype(numpy.float32)
+
+        window = self._get_window(window)
+        if window is not None:
+            frames *= window
+
+        spectrum = numpy.fft.rfft(frames, axis=1)
+        amplitude = numpy.absolute(spectrum).astype(numpy.float32)
+        if phase:
+            return amplitude, numpy.angle(spectrum).astype(numpy.float32)
+
+        return amplitude
+
+    def _get_window(self, window):
+        if window is None:
+            return None
+
+        if isinstance(window, str):
+            functions = {
+                'hann': numpy.hanning,
+                'hanning': numpy.hanning,
+                'hamming': numpy.hamming,
+                'blackman': numpy.blackman,
+                'bartlett': numpy.bartlett,
+            }
+            if window not in functions:
+                raise ValueError('%s window is not supported' % window)
+
+            return functions[window](self.size).astype(numpy.float32)
+
+        window = numpy.asarray(window, dtype=numpy.float32)
+        if window.shape != (self.size,):
+            raise ValueError('window size should be %d' % self.size)
+
+        return window
 
 
 if __name__ == '__main__':
@@ -28,7 +28,13 @@ SOFTWARE.
 import logging
 import os
 import select
-from threading import Thread
+
+try: # Python 2 and Python <= 3.2
+    from monotonic import monotonic
+except: # Python >= 3.3
+    from time import monotonic
+
+from respeaker.gpio_event_loop import gpio_event_loop
 
 Logger = logging.getLogger(__file__)
 
@@ -48,8 +54,6 @@ SYSFS_GPIO_ACTIVE_LOW_PATH = SYSFS_GPIO_PATH + '/active_low'
 SYSFS_GPIO_VALUE_LOW = '0'
 SYSFS_GPIO_VALUE_HIGH = '1'
 
-EPOLL_TIMEOUT = 1  # second
-
 # Public interface
 
 INPUT = 'in'
@@ -76,7 +80,10 @@ class Gpio(object):
     Represent a pin in SysFS
     """
 
-    def __init__(self, number, direction=INPUT, callback=None, edge=None, active_low=0):
+    # epoll events of an edge
+    event_mask = select.EPOLLPRI | select.EPOLLET if hasattr(select, 'EPOLLPRI') else 0
+
+    def __init__(self, number, direction=INPUT, callback=None, edge=None, active_low=0, event_loop=None, debounce=None):
         """
         @type  number: int
         @param number: The pin number
@@ -90,11 +97,18 @@ class Gpio(object):
         @type active_low: int
         @param active_low: Indicator of whether this pin uses inverted
                            logic for HIGH-LOW transitions.
+        @type  event_loop: GpioEventLoop
+        @param event_loop: Loop which waits for edges, the shared
+                           gpio_event_loop if None
+        @type  debounce: float
+        @param debounce: Seconds to ignore edges after an edge, the
+                         default of the event loop if None
         """
         self._number = number
         self._direction = direction
         self._callback = callback
         self._active_low = active_low
+        self._event_loop = None
 
         if not os.path.isfile(self._sysfs_gpio_value_path()):
             with open(SYSFS_EXPORT_PATH, 'w') as export:
@@ -110,22 +124,21 @@ class Gpio(object):
         with open(self._sysfs_gpio_direction_path(), 'w') as fsdir:
             fsdir.write(direction)
 
-        if edge:
-            with open(self._sysfs_gpio_edge_path(), 'w') as fsedge:
-                fsedge.write(edge)
-                self._poll = select.epoll()
-                self._poll.register(self, (select.EPOLLPRI | select.EPOLLET))
-                self.thread = Thread(target=self._run)
-                self.thread.daemon = True
-                self._running = True
-                self.thread.start()
-
         if active_low:
             if active_low not in ACTIVE_LOW_MODES:
                 raise Exception('You must supply a value for active_low which is either 0 or 1.')
             with open(self._sysfs_gpio_active_low_path(), 'w') as fsactive_low:
                 fsactive_low.write(str(active_low))
 
+        if edge:
+            with open(self._sysfs_gpio_edge_path(), 'w') as fsedge:
+                fsedge.write(edge)
+
+            if event_loop is None:
+                event_loop = gpio_event_loop
+            self._event_loop = event_loop
+            event_loop.register(self, lambda number, state, timestamp: self.changed(state), debounce)
+
     @property
     def callback(self):
         """
@@ -198,7 +211,9 @@ class Gpio(object):
             self.reset()
 
     def close(self):
-        self._running = False
+        if self._event_loop is not None:
+            self._event_loop.unregister(self)
+            self._event_loop = None
         self._fd.close()
 
     def fileno(self):
@@ -214,15 +229,14 @@ class Gpio(object):
         if callable(self._callback):
             self._callback(self.number, state)
 
-    def _run(self):
-
-        while self._running:
-            events = self._poll.poll(EPOLL_TIMEOUT)
-            for fd, event in events:
-                if not (event & (select.EPOLLPRI | select.EPOLLET)):
-                    continue
+    def read_events(self):
+        """
+        Get the edge after the value file is signalled, for GpioEventLoop
 
-                self.changed(self.read())
+        @rtype: list
+        @return: [(number, value, timestamp in ns)]
+        """
+        return [(self.number, self.read(), int(monotonic() * 1e9))]
 
     def _sysfs_gpio_value_path(self):
         """
@@ -0,0 +1,460 @@
+"""
+ GPIO through the Linux GPIO character device (uAPI v2, Linux 5.10+)
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import ctypes
+import glob
+import logging
+import os
+import select
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+from respeaker.gpio import INPUT, OUTPUT, RISING, FALLING, BOTH, DIRECTIONS, EDGES, ACTIVE_LOW_MODES
+from respeaker.gpio_event_loop import gpio_event_loop
+from respeaker.ioctl import IOR, IOWR
+
+logger = logging.getLogger('gpio')
+
+# linux/gpio.h
+
+GPIO_MAX_NAME_SIZE = 32
+GPIO_V2_LINES_MAX = 64
+GPIO_V2_LINE_NUM_ATTRS_MAX = 10
+
+GPIO_V2_LINE_FLAG_ACTIVE_LOW = 1 << 1
+GPIO_V2_LINE_FLAG_INPUT = 1 << 2
+GPIO_V2_LINE_FLAG_OUTPUT = 1 << 3
+GPIO_V2_LINE_FLAG_EDGE_RISING = 1 << 4
+GPIO_V2_LINE_FLAG_EDGE_FALLING = 1 << 5
+
+GPIO_V2_LINE_ATTR_ID_FLAGS = 1
+GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES = 2
+GPIO_V2_LINE_ATTR_ID_DEBOUNCE = 3
+
+GPIO_V2_LINE_EVENT_RISING_EDGE = 1
+GPIO_V2_LINE_EVENT_FALLING_EDGE = 2
+
+
+class _ChipInfo(ctypes.Structure):
+    _fields_ = [
+        ('name', ctypes.c_char * GPIO_MAX_NAME_SIZE),
+        ('label', ctypes.c_char * GPIO_MAX_NAME_SIZE),
+        ('lines', ctypes.c_uint32),
+    ]
+
+
+class _AttributeValue(ctypes.Union):
+    _fields_ = [
+        ('flags', ctypes.c_uint64),
+        ('values', ctypes.c_uint64),
+        ('debounce_period_us', ctypes.c_uint32),
+    ]
+
+
+class _LineAttribute(ctypes.Structure):
+    _anonymous_ = ('value',)
+    _fields_ = [
+        ('id', ctypes.c_uint32),
+        ('padding', ctypes.c_uint32),
+        ('value', _AttributeValue),
+    ]
+
+
+class _LineConfigAttribute(ctypes.Structure):
+    _fields_ = [
+        ('attr', _LineAttribute),
+        ('mask', ctypes.c_uint64),
+    ]
+
+
+class _LineConfig(ctypes.Structure):
+    _fields_ = [
+        ('flags', ctypes.c_uint64),
+        ('num_attrs', ctypes.c_uint32),
+        ('padding', ctypes.c_uint32 * 5),
+        ('attrs', _LineConfigAttribute * GPIO_V2_LINE_NUM_ATTRS_MAX),
+    ]
+
+
+class _LineRequest(ctypes.Structure):
+    _fields_ = [
+        ('offsets', ctypes.c_uint32 * GPIO_V2_LINES_MAX),
+        ('consumer', ctypes.c_char * GPIO_MAX_NAME_SIZE),
+        ('config', _LineConfig),
+        ('num_lines', ctypes.c_uint32),
+        ('event_buffer_size', ctypes.c_uint32),
+        ('padding', ctypes.c_uint32 * 5),
+        ('fd', ctypes.c_int32),
+    ]
+
+
+class _LineValues(ctypes.Structure):
+    _fields_ = [
+        ('bits', ctypes.c_uint64),
+        ('mask', ctypes.c_uint64),
+    ]
+
+
+class _LineEvent(ctypes.Structure):
+    _fields_ = [
+        ('timestamp_ns', ctypes.c_uint64),
+        ('id', ctypes.c_uint32),
+        ('offset', ctypes.c_uint32),
+        ('seqno', ctypes.c_uint32),
+        ('line_seqno', ctypes.c_uint32),
+        ('padding', ctypes.c_uint32 * 6),
+    ]
+
+
+GPIO_GET_CHIPINFO_IOCTL = IOR(0xB4, 0x01, ctypes.sizeof(_ChipInfo))
+GPIO_V2_GET_LINE_IOCTL = IOWR(0xB4, 0x07, ctypes.sizeof(_LineRequest))
+GPIO_V2_LINE_SET_CONFIG_IOCTL = IOWR(0xB4, 0x0D, ctypes.sizeof(_LineConfig))
+GPIO_V2_LINE_GET_VALUES_IOCTL = IOWR(0xB4, 0x0E, ctypes.sizeof(_LineValues))
+GPIO_V2_LINE_SET_VALUES_IOCTL = IOWR(0xB4, 0x0F, ctypes.sizeof(_LineValues))
+
+EVENT_SIZE = ctypes.sizeof(_LineEvent)
+
+
+def is_available():
+    return fcntl is not None and bool(glob.glob('/dev/gpiochip*'))
+
+
+def chip_info(path):
+    """
+    Returns:
+        (label, number of lines) of the GPIO chip
+    """
+    info = _ChipInfo()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fcntl.ioctl(fd, GPIO_GET_CHIPINFO_IOCTL, info, True)
+    finally:
+        os.close(fd)
+
+    return info.label.decode(), info.lines
+
+
+def find_line(number):
+    """
+    Find the chip and the offset of a GPIO numbered as in /sys/class/gpio
+
+    Returns:
+        (path of the chip, offset)
+    """
+    bases = {}
+    for path in glob.glob('/sys/class/gpio/gpiochip*'):
+        try:
+            with open(os.path.join(path, 'label')) as f:
+                label = f.read().strip()
+            with open(os.path.join(path, 'base')) as f:
+                bases[label] = int(f.read())
+        except (IOError, OSError, ValueError):
+            pass
+
+    chips = sorted(glob.glob('/dev/gpiochip*'), key=lambda p: int(p[len('/dev/gpiochip'):]))
+    base = 0
+    for chip in chips:
+        label, lines = chip_info(chip)
+        # without the sysfs class, assume the chips are numbered one after another
+        base = bases.get(label, base)
+        if base <= number < base + lines:
+            return chip, number - base
+        base += lines
+
+    raise ValueError('GPIO %d is not found' % number)
+
+
+def _flags(direction, edge, active_low):
+    if direction not in DIRECTIONS:
+        raise ValueError('%s direction is not supported' % direction)
+
+    flags = GPIO_V2_LINE_FLAG_OUTPUT if direction == OUTPUT else GPIO_V2_LINE_FLAG_INPUT
+    if edge:
+        if edge not in EDGES or direction != INPUT:
+            raise ValueError('%s edge is not supported for %s' % (edge, direction))
+        if edge in (RISING, BOTH):
+            flags |= GPIO_V2_LINE_FLAG_EDGE_RISING
+        if edge in (FALLING, BOTH):
+            flags |= GPIO_V2_LINE_FLAG_EDGE_FALLING
+    if active_low:
+        if active_low not in ACTIVE_LOW_MODES:
+            raise ValueError('You must supply a value for active_low which is either 0 or 1.')
+        flags |= GPIO_V2_LINE_FLAG_ACTIVE_LOW
+
+    return flags
+
+
+class GpioLines(object):
+    """
+    Lines of a GPIO chip requested together
+
+    The values of any of the lines are read or written with one ioctl, and the
+    request keeps a single file descriptor open, which is readable when an
+    edge is detected.
+    """
+
+    # epoll events of an edge
+    event_mask = getattr(select, 'EPOLLIN', 0)
+
+    def __init__(self, offsets, direction=INPUT, chip='/dev/gpiochip0', edge=None, active_low=0, values=None,
+                 debounce=0, consumer='respeaker'):
+        """
+
+        Args:
+            offsets: list of line offsets on the chip
+            direction: INPUT or OUTPUT, or a list with the direction of each line
+            chip: path of the GPIO chip
+            edge: RISING, FALLING or BOTH to detect edges of the input lines
+            active_low: 1 to invert the logic of all lines
+            values: list of initial values of the output lines
+            debounce: debounce period of the input lines in microseconds
+            consumer: name of the user of the lines shown by the kernel
+        """
+        if not 0 < len(offsets) <= GPIO_V2_LINES_MAX:
+            raise ValueError('1 - %d lines can be requested' % GPIO_V2_LINES_MAX)
+
+        self.offsets = list(offsets)
+        self.chip = chip
+        self.edge = edge
+        self.active_low = active_low
+        self.debounce = debounce
+
+        request = _LineRequest()
+        for i, offset in enumerate(self.offsets):
+            request.offsets[i] = offset
+        request.consumer = consumer.encode()
+        request.num_lines = len(self.offsets)
+        request.config = self._config(direction, values)
+
+        fd = os.open(chip, os.O_RDONLY)
+        try:
+            fcntl.ioctl(fd, GPIO_V2_GET_LINE_IOCTL, request, True)
+        finally:
+            os.close(fd)
+
+        self.fd = request.fd
+        self.values = _LineValues()
+        self.closed = False
+
+    def _config(self, direction, values=None):
+        directions = direction if isinstance(direction, (list, tuple)) else [direction] * len(self.offsets)
+        self.directions = list(directions)
+
+        groups = {}
+        for i, d in enumerate(directions):
+            flags = _flags(d, self.edge if d == INPUT else None, self.active_low)
+            groups[flags] = groups.get(flags, 0) | (1 << i)
+
+        config = _LineConfig()
+        attributes = []
+        for flags, mask in groups.items():
+            if not config.flags:
+                config.flags = flags
+            else:
+                attributes.append((GPIO_V2_LINE_ATTR_ID_FLAGS, 'flags', flags, mask))
+
+        outputs = sum(1 << i for i, d in enumerate(directions) if d == OUTPUT)
+        if values and outputs:
+            bits = sum(1 << i for i, v in enumerate(values) if v)
+            attributes.append((GPIO_V2_LINE_ATTR_ID_OUTPUT_VALUES, 'values', bits, outputs))
+
+        inputs = sum(1 << i for i, d in enumerate(directions) if d == INPUT)
+        if self.debounce and inputs:
+            attributes.append((GPIO_V2_LINE_ATTR_ID_DEBOUNCE, 'debounce_period_us', self.debounce, inputs))
+
+        for n, (id, name, value, mask) in enumerate(attributes):
+            config.attrs[n].attr.id = id
+            setattr(config.attrs[n].attr, name, value)
+            config.attrs[n].mask = mask
+        config.num_attrs = len(attributes)
+
+        return config
+
+    def set_direction(self, direction, values=None):
+        """
+        Change the direction of the lines without releasing them
+        """
+        fcntl.ioctl(self.fd, GPIO_V2_LINE_SET_CONFIG_IOCTL, self._config(direction, values), True)
+
+    def get_bits(self, mask=None):
+        """
+        Read the lines selected by mask with one ioctl
+
+        Returns:
+            int with bit i set when the i-th line is high
+        """
+        values = self.values
+        values.mask = mask if mask is not None else (1 << len(self.offsets)) - 1
+        fcntl.ioctl(self.fd, GPIO_V2_LINE_GET_VALUES_IOCTL, values, True)
+        return values.bits
+
+    def set_bits(self, bits, mask):
+        """
+        Write the lines selected by mask with one ioctl, bit i is the value of the i-th line
+        """
+        values = self.values
+        values.bits = bits
+        values.mask = mask
+        fcntl.ioctl(self.fd, GPIO_V2_LINE_SET_VALUES_IOCTL, values, True)
+
+    def get_values(self):
+        """
+        Returns:
+            list of the values of all lines
+        """
+        bits = self.get_bits()
+        return [(bits >> i) & 1 for i in range(len(self.offsets))]
+
+    def set_values(self, values):
+        """
+        Args:
+            values: list of values, one for each line, None to keep a line unchanged
+        """
+        bits = mask = 0
+        for i, value in enumerate(values):
+            if value is None:
+                continue
+            mask |= 1 << i
+            if value:
+                bits |= 1 << i
+
+        self.set_bits(bits, mask)
+
+    def read_events(self):
+        """
+        Read the pending edge events
+
+        Returns:
+            list of (offset, value after the edge, kernel timestamp in ns)
+        """
+        data = os.read(self.fd, EVENT_SIZE * 16)
+        events = []
+        for start in range(0, len(data) - EVENT_SIZE + 1, EVENT_SIZE):
+            event = _LineEvent.from_buffer_copy(data[start:start + EVENT_SIZE])
+            events.append((event.offset, 1 if event.id == GPIO_V2_LINE_EVENT_RISING_EDGE else 0, event.timestamp_ns))
+
+        return events
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            os.close(self.fd)
+
+
+class Gpio(object):
+    """
+    A pin with the same interface as respeaker.gpio.Gpio, through the GPIO character device
+
+    The line is requested once, so reading or writing the pin is a single
+    ioctl, and changing the direction does not reopen any file. Edges are
+    timestamped by the kernel and dispatched by a GpioEventLoop.
+    """
+
+    event_mask = getattr(select, 'EPOLLIN', 0)
+
+    def __init__(self, number, direction=INPUT, callback=None, edge=None, active_low=0, value=0,
+                 event_loop=None, debounce=None):
+        """
+
+        Args:
+            number: the pin number, as in /sys/class/gpio
+            direction: INPUT or OUTPUT
+            callback: called as callback(number, state) when the pin changes state
+            edge: RISING, FALLING or BOTH, the edge which triggers callback
+            active_low: 1 to invert the logic of the pin
+            value: initial value of an output
+            event_loop: GpioEventLoop which waits for edges, the shared gpio_event_loop if None
+            debounce: seconds to ignore edges after an edge, the default of the event loop if None
+        """
+        if callback and not edge:
+            raise Exception('You must supply a edge to trigger callback on')
+
+        self._number = number
+        self._direction = direction
+        self._callback = callback
+        self._active_low = active_low
+
+        chip, offset = find_line(number)
+        self.lines = GpioLines([offset], direction, chip, edge=edge, active_low=active_low, values=[value])
+
+        self._event_loop = None
+        if edge:
+            self._event_loop = event_loop if event_loop is not None else gpio_event_loop
+            self._event_loop.register(self, lambda number, state, timestamp: self.changed(state), debounce)
+
+    @property
+    def callback(self):
+        return self._callback
+
+    @callback.setter
+    def callback(self, value):
+        self._callback = value
+
+    @property
+    def direction(self):
+        return self._direction
+
+    @property
+    def number(self):
+        return self._number
+
+    @property
+    def active_low(self):
+        return self._active_low
+
+    def dir(self, direction):
+        self._direction = direction
+        self.lines.set_direction(direction)
+
+    def set(self):
+        self.lines.set_bits(1, 1)
+
+    def reset(self):
+        self.lines.set_bits(0, 1)
+
+    def read(self):
+        return self.lines.get_bits(1)
+
+    def write(self, value):
+        self.lines.set_bits(1 if value else 0, 1)
+
+    def close(self):
+        if self._event_loop is not None:
+            self._event_loop.unregister(self)
+            self._event_loop = None
+        self.lines.close()
+
+    def fileno(self):
+        return self.lines.fileno()
+
+    def read_events(self):
+        return [(self.number, value, timestamp) for _, value, timestamp in self.lines.read_events()]
+
+    def changed(self, state):
+        if callable(self._callback):
+            self._callback(self.number, state)
+
+
+__all__ = ('DIRECTIONS', 'INPUT', 'OUTPUT', 'EDGES', 'RISING', 'FALLING', 'BOTH', 'Gpio', 'GpioLines', 'find_line')
@@ -0,0 +1,175 @@
+"""
+ Dispatch the edge events of all GPIOs from one epoll
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import logging
+import os
+import select
+import threading
+
+from respeaker.lazy import LazyInstance
+
+logger = logging.getLogger('gpio')
+
+
+class _Source(object):
+    def __init__(self, source, callback, debounce):
+        self.source = source
+        self.callback = callback
+        self.debounce = debounce
+        self.last = {}  # id -> timestamp of the last accepted edge
+
+
+class GpioEventLoop(object):
+    """
+    Wait for the edges of any number of pins with one epoll
+
+    A source is a sysfs or character device Gpio, or a GpioLines with edge
+    detection. It has event_mask, the epoll events which mean it has edges,
+    and read_events(), which returns a list of (id, value, timestamp in ns).
+    The character device timestamps edges in the kernel. For sysfs pins the
+    time of the wakeup is used.
+
+    Edges of the same id which come less than debounce seconds after the
+    last accepted one are dropped. Callbacks are called as
+    callback(id, value, timestamp) on the thread of the loop, or submitted to
+    executor, e.g. a concurrent.futures.ThreadPoolExecutor.
+
+    The loop runs in its own thread, started when the first source is
+    registered, unless it is attached to an asyncio event loop.
+    """
+
+    def __init__(self, executor=None, debounce=0):
+        """
+
+        Args:
+            executor: object with submit(function, *args) to run the callbacks, None to run them on the loop
+            debounce: default debounce period in seconds
+        """
+        self.executor = executor
+        self.debounce = debounce
+        self.poll = select.epoll()
+        self.sources = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.loop = None
+        self.closed = False
+
+        # to wake up the thread when closing
+        self.wakeup, self.wakeup_write = os.pipe()
+        self.poll.register(self.wakeup, select.EPOLLIN)
+
+    def register(self, source, callback, debounce=None):
+        """
+        Call callback on the edges of source
+
+        Args:
+            source: the pin or lines
+            callback: called as callback(id, value, timestamp)
+            debounce: debounce period in seconds, the default of the loop if None
+        """
+        debounce = self.debounce if debounce is None else debounce
+        with self.lock:
+            if self.closed:
+                raise ValueError('GpioEventLoop is closed')
+
+            fd = source.fileno()
+            self.sources[fd] = _Source(source, callback, int(debounce * 1e9))
+            self.poll.register(fd, source.event_mask)
+
+            if self.thread is None and self.loop is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def unregister(self, source):
+        with self.lock:
+            if self.sources.pop(source.fileno(), None) is not None:
+                self.poll.unregister(source.fileno())
+
+    def attach(self, loop):
+        """
+        Dispatch the events in an asyncio event loop instead of a thread
+        """
+        with self.lock:
+            if self.thread is not None:
+                raise ValueError('GpioEventLoop is already running in a thread')
+            self.loop = loop
+
+        loop.add_reader(self.poll.fileno(), self.dispatch, 0)
+
+    def detach(self):
+        if self.loop is not None:
+            self.loop.remove_reader(self.poll.fileno())
+            self.loop = None
+
+    def dispatch(self, timeout=-1):
+        """
+        Wait at most timeout seconds for events and run their callbacks, -1 to wait forever
+        """
+        for fd, event in self.poll.poll(timeout):
+            if fd == self.wakeup:
+                os.read(self.wakeup, 64)
+                continue
+
+            source = self.sources.get(fd)
+            if source is None:
+                continue
+
+            try:
+                events = source.source.read_events()
+            except (IOError, OSError) as e:
+                logger.warning('Failed to read GPIO events - {}'.format(e))
+                continue
+
+            for id, value, timestamp in events:
+                last = source.last.get(id)
+                if last is not None and timestamp - last < source.debounce:
+                    continue
+                source.last[id] = timestamp
+
+                if self.executor is not None:
+                    self.executor.submit(source.callback, id, value, timestamp)
+                    continue
+
+                try:
+                    source.callback(id, value, timestamp)
+                except Exception as e:
+                    logger.exception('GPIO callback failed - {}'.format(e))
+
+    def _run(self):
+        while not self.closed:
+            self.dispatch()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.sources = {}
+
+        self.detach()
+        if self.thread is not None:
+            os.write(self.wakeup_write, b'q')
+            self.thread.join()
+
+        self.poll.close()
+        os.close(self.wakeup)
+        os.close(self.wakeup_write)
+
+
+# the loop used by pins with a callback, it is created by the first of them
+gpio_event_loop = LazyInstance(GpioEventLoop)
@@ -0,0 +1,46 @@
+"""
+ Linux ioctl request numbers, see asm-generic/ioctl.h
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import platform
+
+if platform.machine().startswith(('mips', 'ppc', 'powerpc', 'sparc')):
+    # 13 size bits and 3 direction bits
+    IOC_NONE, IOC_READ, IOC_WRITE = 1, 2, 4
+    IOC_DIRSHIFT = 29
+else:
+    IOC_NONE, IOC_READ, IOC_WRITE = 0, 2, 1
+    IOC_DIRSHIFT = 30
+
+
+def IOC(direction, type, number, size):
+    if not isinstance(type, int):
+        type = ord(type)
+    return (direction << IOC_DIRSHIFT) | (size << 16) | (type << 8) | number
+
+
+def IOR(type, number, size):
+    return IOC(IOC_READ, type, number, size)
+
+
+def IOW(type, number, size):
+    return IOC(IOC_WRITE, type, number, size)
+
+
+def IOWR(type, number, size):
+    return IOC(IOC_READ | IOC_WRITE, type, number, size)
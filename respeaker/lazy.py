@@ -0,0 +1,50 @@
+"""
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import threading
+
+
+class LazyInstance(object):
+    """
+    Stand-in for a module-level singleton which creates it on first use
+
+    Creating devices such as PixelRing or SPI enumerates USB or exports GPIOs,
+    so it should not happen as a side effect of importing the library.
+    """
+
+    def __init__(self, factory):
+        self.__dict__['_factory'] = factory
+        self.__dict__['_instance'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def get(self):
+        """
+        Returns:
+            the real object, created when called the first time
+        """
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self.__dict__['_instance'] = self._factory()
+
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get(), name, value)
@@ -23,17 +23,14 @@ import collections
 import random
 import string
 import logging
-from threading import Thread, Event
-
-try: # Python 2
-    import Queue
-except: # Python 3
-    import queue as Queue
+from threading import Thread, Event, RLock
 
 import pyaudio
 
-from respeaker.pixel_ring import pixel_ring
-from respeaker.vad import vad
+from respeaker.pixel_ring import pixel_ring as default_pixel_ring
+from respeaker.audio_bus import AudioBus, DROP_OLDEST, BLOCK
+from respeaker.device_registry import registry
+from respeaker.vad import WebRTCVAD
 
 
 logger = logger = logging.getLogger('mic')
@@ -44,6 +41,20 @@ def random_string(length):
     return ''.join(random.choice(string.digits) for _ in range(length))
 
 
+def find_devices(pyaudio_instance, keyword=b'respeaker'):
+    """
+    Returns:
+        indexes of the input devices whose name contains keyword
+    """
+    devices = []
+    for dev in registry.audio_devices(pyaudio_instance):
+        name = dev['name'].encode('utf-8')
+        if name.lower().find(keyword) >= 0:
+            devices.append(dev['index'])
+
+    return devices
+
+
 def save_as_wav(data, prefix):
     prefix = prefix.replace(' ', '_')
     filename = prefix + random_string(8) + '.wav'
@@ -60,31 +71,94 @@ def save_as_wav(data, prefix):
     logger.info('Save audio as %s' % filename)
 
 
+class SpeechGate(object):
+    """
+    Pick speech chunks out of a chunk stream with VAD, with a few chunks before the speech onset
+    """
+
+    def __init__(self, vad, chunks, silence_chunks, history=8):
+        """
+
+        Args:
+            vad: voice activity detector with is_speech(data)
+            chunks: max chunks to pass on
+            silence_chunks: max silent chunks to see
+            history: chunks before speech onset to pass on
+        """
+        self.vad = vad
+        self.countdown = [chunks, silence_chunks]
+        self.history = collections.deque(maxlen=history)
+        self.active = False
+
+    @property
+    def done(self):
+        return self.countdown[0] <= 0 or self.countdown[1] <= 0
+
+    def push(self, data):
+        """
+        Returns:
+            list of chunks to pass on
+        """
+        if self.vad.is_speech(data):
+            output = []
+            if not self.active:
+                output.extend(self.history)
+                self.countdown[0] -= len(self.history)
+                self.history.clear()
+
+            output.append(data)
+            self.countdown[0] -= 1
+            self.active = True
+        else:
+            if self.active:
+                output = [data]
+            else:
+                output = []
+                self.history.append(data)
+
+            self.countdown[1] -= 1
+            self.active = False
+
+        return output
+
+
 class Microphone:
     sample_rate = 16000
     frames_per_buffer = 512
-    listening_mask = (1 << 0)
-    detecting_mask = (1 << 1)
-    recording_mask = (1 << 2)
-
-    def __init__(self, pyaudio_instance=None, quit_event=None, decoder=None):
-        pixel_ring.set_color(rgb=0x400000)
+    chunk_bytes = frames_per_buffer * 2     # S16_LE, mono
+    listen_history_chunks = 8
+    detect_history_chunks = 48
+
+    def __init__(self, pyaudio_instance=None, quit_event=None, decoder=None, decoder_process=False,
+                 device_index=None, pixel_ring=None, vad_options=None):
+        """
+
+        Args:
+            pyaudio_instance: PyAudio instance to use, a new one is created if None
+            quit_event: threading.Event to stop detecting and listening
+            decoder: pocketsphinx Decoder to use, created by create_decoder() if None
+            decoder_process: if true and decoder is None, run the decoder in a worker process
+            device_index: PortAudio input device, the first ReSpeaker or the default input device if None
+            pixel_ring: PixelRing of the device, the global pixel_ring if None
+            vad_options: dict of WebRTCVAD options (level, frame_ms, onset, hangover) for listen()
+        """
+        self.pixel_ring = pixel_ring if pixel_ring else default_pixel_ring
+        self.pixel_ring.set_color(rgb=0x400000)
 
         self.pyaudio_instance = pyaudio_instance if pyaudio_instance else pyaudio.PyAudio()
 
-        self.device_index = None
-        for i in range(self.pyaudio_instance.get_device_count()):
-            dev = self.pyaudio_instance.get_device_info_by_index(i)
-            name = dev['name'].encode('utf-8')
-            # print(i, name, dev['maxInputChannels'], dev['maxOutputChannels'])
-            if name.lower().find(b'respeaker') >= 0 and dev['maxInputChannels'] > 0:
-                logger.info('Use {}'.format(name))
-                self.device_index = i
-                break
-
-        if not self.device_index:
-            device = self.pyaudio_instance.get_default_input_device_info()
-            self.device_index = device['index']
+        if device_index is None:
+            devices = find_devices(self.pyaudio_instance)
+            if devices:
+                device_index = devices[0]
+                logger.info('Use {}'.format(self.pyaudio_instance.get_device_info_by_index(device_index)['name']))
+            else:
+                device_index = self.pyaudio_instance.get_default_input_device_info()['index']
+
+        self.device_index = device_index
+        self.vad_options = vad_options if vad_options else {}
+        # input overflows reported by PortAudio
+        self.overflows = 0
         self.stream = self.pyaudio_instance.open(
             input=True,
             start=False,
@@ -98,21 +172,20 @@ class Microphone:
 
         self.quit_event = quit_event if quit_event else Event()
 
-        self.listen_queue = Queue.Queue()
-        self.detect_queue = Queue.Queue()
+        # about 16 seconds of audio shared by all consumers
+        self.bus = AudioBus(self.chunk_bytes * 512)
+        # held across a subscription change and the start or stop of the stream which follows it
+        self.stream_lock = RLock()
 
-        self.decoder = decoder if decoder else self.create_decoder()
+        if decoder:
+            self.decoder = decoder
+        elif decoder_process:
+            from respeaker.decoder_process import DecoderProcess
+            self.decoder = DecoderProcess(Microphone.create_decoder)
+        else:
+            self.decoder = self.create_decoder()
         self.decoder.start_utt()
-
-        self.status = 0
-        self.active = False
-
-        self.listen_history = collections.deque(maxlen=8)
-        self.detect_history = collections.deque(maxlen=48)
-
-        self.wav = None
-        self.record_countdown = None
-        self.listen_countdown = [0, 0]
+        self.detect_mark = 0
 
     @staticmethod
     def create_decoder():
@@ -135,6 +208,13 @@ class Microphone:
 
         return Decoder(config)
 
+    def create_vad(self):
+        """
+        Returns:
+            a new WebRTCVAD with vad_options, every listen session gets its own one
+        """
+        return WebRTCVAD(self.sample_rate, **self.vad_options)
+
     def recognize(self, data):
         self.decoder.end_utt()
         self.decoder.start_utt()
@@ -155,152 +235,187 @@ class Microphone:
 
         return ''
 
+    def subscribe(self, frame_bytes=None, policy=DROP_OLDEST, history=0):
+        """
+        Attach a consumer to the capture stream, the stream is started if needed
+
+        Args:
+            frame_bytes: bytes returned by every read, None for all available data
+            policy: DROP_OLDEST or BLOCK, what to do when the consumer falls behind
+            history: bytes of already captured audio the consumer starts with
+
+        Returns:
+            Subscription, call unsubscribe() when done
+        """
+        with self.stream_lock:
+            subscription = self.bus.subscribe(frame_bytes, policy, history)
+            self.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.stream_lock:
+            self.bus.unsubscribe(subscription)
+            self.stop()
+
     def detect(self, keyword=None):
-        self.decoder.end_utt()
-        self.decoder.start_utt()
+        subscription = self._start_detect()
 
-        pixel_ring.off()
+        result = None
+        overruns = 0
+        try:
+            while not self.quit_event.is_set():
+                size = subscription.available() // self.chunk_bytes
+                if size > 4:
+                    logger.info('Too many delays, {} in queue'.format(size))
 
-        self.detect_history.clear()
+                if subscription.overruns != overruns:
+                    logger.info('Dropped {} bytes'.format(subscription.dropped))
+                    overruns = subscription.overruns
 
-        self.detect_queue.queue.clear()
-        self.status |= self.detecting_mask
-        self.stream.start_stream()
+                data = subscription.read(timeout=1)
+                if not data:
+                    continue
 
-        result = None
-        logger.info('Start detecting')
-        while not self.quit_event.is_set():
-            size = self.detect_queue.qsize()
-            if size > 4:
-                logger.info('Too many delays, {} in queue'.format(size))
-
-            data = self.detect_queue.get()
-            self.detect_history.append(data)
-            self.decoder.process_raw(data, False, False)
-
-            hypothesis = self.decoder.hyp()
-            if hypothesis:
-                logger.info('Detected {}'.format(hypothesis.hypstr))
-                if collecting_audio != 'no':
-                    logger.debug(collecting_audio)
-                    save_as_wav(b''.join(self.detect_history), hypothesis.hypstr)
-                self.detect_history.clear()
-                if keyword:
-                    if hypothesis.hypstr.find(keyword) >= 0:
-                        result = hypothesis.hypstr
-                        break
-                    else:
-                        self.decoder.end_utt()
-                        self.decoder.start_utt()
-                        self.detect_history.clear()
-                else:
-                    result = hypothesis.hypstr
+                result = self._spot(data, keyword, subscription)
+                if result:
                     break
-
-        self.status &= ~self.detecting_mask
-        self.stop()
+        finally:
+            self.unsubscribe(subscription)
 
         return result
 
     wakeup = detect
 
-    def listen(self, duration=9, timeout=3):
-        vad.reset()
+    def _start_detect(self):
+        self.decoder.end_utt()
+        self.decoder.start_utt()
+
+        self.pixel_ring.off()
 
-        self.listen_countdown[0] = (duration * self.sample_rate + self.frames_per_buffer - 1) / self.frames_per_buffer
-        self.listen_countdown[1] = (timeout * self.sample_rate + self.frames_per_buffer - 1) / self.frames_per_buffer
+        subscription = self.subscribe(self.chunk_bytes)
+        self.detect_mark = subscription.cursor
+        logger.info('Start detecting')
 
-        self.listen_queue.queue.clear()
-        self.status |= self.listening_mask
-        self.start()
-        pixel_ring.listen()
+        return subscription
 
-        logger.info('Start listening')
+    def _spot(self, data, keyword, subscription):
+        """
+        Feed a chunk to the keyword decoder
+
+        Returns:
+            the detected text which contains keyword (any text if keyword is None), otherwise None
+        """
+        self.decoder.process_raw(data, False, False)
+
+        hypothesis = self.decoder.hyp()
+        if not hypothesis:
+            return None
+
+        logger.info('Detected {}'.format(hypothesis.hypstr))
+        if collecting_audio != 'no':
+            logger.debug(collecting_audio)
+            start = max(self.detect_mark, subscription.cursor - self.chunk_bytes * self.detect_history_chunks)
+            save_as_wav(self.bus.copy(start, subscription.cursor - start), hypothesis.hypstr)
+        self.detect_mark = subscription.cursor
+
+        if keyword and hypothesis.hypstr.find(keyword) < 0:
+            self.decoder.end_utt()
+            self.decoder.start_utt()
+            return None
+
+        return hypothesis.hypstr
+
+    def listen(self, duration=9, timeout=3, vad=None):
+        subscription, gate = self._start_listen(duration, timeout, vad)
 
         def _listen():
             try:
-                data = self.listen_queue.get(timeout=timeout)
-                while data and not self.quit_event.is_set():
-                    yield data
-                    data = self.listen_queue.get(timeout=timeout)
-            except Queue.Empty:
-                pass
+                while not gate.done and not self.quit_event.is_set():
+                    data = subscription.read(timeout=timeout)
+                    if not data:
+                        break
 
-            self.stop()
+                    for d in gate.push(data):
+                        yield d
+            finally:
+                self._stop_listen(subscription)
 
         return _listen()
 
+    def _start_listen(self, duration, timeout, vad=None):
+        gate = self._gate(duration, timeout, vad)
+
+        subscription = self.subscribe(self.chunk_bytes)
+        self.pixel_ring.listen()
+
+        logger.info('Start listening')
+
+        return subscription, gate
+
+    def _gate(self, duration, timeout, vad=None):
+        if vad is None:
+            vad = self.create_vad()
+        else:
+            vad.reset()
+
+        return SpeechGate(vad,
+                          (duration * self.sample_rate + self.frames_per_buffer - 1) // self.frames_per_buffer,
+                          (timeout * self.sample_rate + self.frames_per_buffer - 1) // self.frames_per_buffer,
+                          self.listen_history_chunks)
+
+    def _stop_listen(self, subscription):
+        self.unsubscribe(subscription)
+        self.pixel_ring.wait()
+        logger.info('Stop listening')
+
     def record(self, file_name, seconds=1800):
-        self.wav = wave.open(file_name, 'wb')
-        self.wav.setsampwidth(2)
-        self.wav.setnchannels(1)
-        self.wav.setframerate(self.sample_rate)
-        self.record_countdown = (seconds * self.sample_rate + self.frames_per_buffer - 1) / self.frames_per_buffer
-        self.status |= self.recording_mask
-        self.start()
+        subscription = self.subscribe(self.chunk_bytes, policy=BLOCK)
+
+        def _record():
+            wav = wave.open(file_name, 'wb')
+            wav.setsampwidth(2)
+            wav.setnchannels(1)
+            wav.setframerate(self.sample_rate)
+            countdown = (seconds * self.sample_rate + self.frames_per_buffer - 1) // self.frames_per_buffer
+            try:
+                for data in subscription:
+                    wav.writeframes(data)
+                    countdown -= 1
+                    if countdown <= 0:
+                        break
+            finally:
+                self.unsubscribe(subscription)
+                wav.close()
+
+        thread = Thread(target=_record)
+        thread.daemon = True
+        thread.start()
 
     def quit(self):
-        self.status = 0
         self.quit_event.set()
-        self.listen_queue.put('')
-        if self.wav:
-            self.wav.close()
-            self.wav = None
+        self.bus.close()
 
     def start(self):
-        if self.stream.is_stopped():
-            self.stream.start_stream()
+        with self.stream_lock:
+            if self.stream.is_stopped():
+                self.stream.start_stream()
 
     def stop(self):
-        if not self.status and self.stream.is_active():
-            self.stream.stop_stream()
+        with self.stream_lock:
+            if not self.bus.subscriptions and self.stream.is_active():
+                self.stream.stop_stream()
 
     def close(self):
         self.quit()
         self.stream.close()
+        if hasattr(self.decoder, 'close'):
+            self.decoder.close()
 
     def _callback(self, in_data, frame_count, time_info, status):
-        if self.status & self.recording_mask:
-            pass
-
-        if self.status & self.detecting_mask:
-            self.detect_queue.put(in_data)
-
-        if self.status & self.listening_mask:
-            active = vad.is_speech(in_data)
-            if active:
-                if not self.active:
-                    for d in self.listen_history:
-                        self.listen_queue.put(d)
-                        self.listen_countdown[0] -= 1
-
-                    self.listen_history.clear()
-
-                self.listen_queue.put(in_data)
-                self.listen_countdown[0] -= 1
-            else:
-                if self.active:
-                    self.listen_queue.put(in_data)
-                else:
-                    self.listen_history.append(in_data)
-
-                self.listen_countdown[1] -= 1
-
-            if self.listen_countdown[0] <= 0 or self.listen_countdown[1] <= 0:
-                self.listen_queue.put('')
-                self.status &= ~self.listening_mask
-                pixel_ring.wait()
-                logger.info('Stop listening')
-
-            self.active = active
-
-        if self.status & self.recording_mask:
-            self.wav.writeframes(in_data)
-            self.record_countdown -= 1
-            if self.record_countdown <= 0:
-                self.status &= ~self.recording_mask
-                self.wav.close()
+        if status & pyaudio.paInputOverflow:
+            self.overflows += 1
 
+        self.bus.write(in_data)
         return None, pyaudio.paContinue
 
 
@@ -0,0 +1,255 @@
+"""
+ Serve all ReSpeaker microphone arrays of a host in one process
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import logging
+import threading
+import time
+
+try: # Python 2
+    import Queue
+except: # Python 3
+    import queue as Queue
+
+import pyaudio
+
+import respeaker.usb_hid
+from respeaker.device_registry import usb_address_of_audio_device, usb_address_of_hid
+from respeaker.microphone import Microphone, find_devices
+from respeaker.pixel_ring import PixelRing
+
+
+logger = logging.getLogger('mic')
+
+
+class Device(object):
+    """
+    State of one microphone array served by MicrophoneManager
+    """
+
+    def __init__(self, microphone):
+        self.microphone = microphone
+        self.subscription = None
+        self.gate = None
+        self.speech = []
+        self.scheduled = False
+        self.chunks = 0
+        self.detections = 0
+
+
+class MicrophoneManager(object):
+    """
+    Capture, VAD and keyword spotting for every ReSpeaker array of the host
+
+    Each array keeps its own PortAudio stream, decoder and VAD, but the audio
+    is processed by a small shared pool of worker threads. A device is queued
+    for the pool when new audio arrives, so the number of threads does not
+    grow with the number of arrays.
+
+    PortAudio devices and USB HID interfaces are paired by the USB device they
+    belong to. An array whose HID interface can not be found has no USB LED
+    control.
+    """
+
+    def __init__(self, keyword=None, on_detect=None, on_speech=None, workers=2, pyaudio_instance=None,
+                 decoder_process=False, duration=9, timeout=3):
+        """
+
+        Args:
+            keyword: keyword to spot, any keyword in the keyword list if None
+            on_detect: called as on_detect(microphone, text) when a keyword is detected
+            on_speech: if set, capture speech after the keyword and call on_speech(microphone, data)
+            workers: number of worker threads shared by all arrays
+            pyaudio_instance: PyAudio instance to use, a new one is created if None
+            decoder_process: if true, run each decoder in a worker process
+            duration: max seconds of speech after the keyword
+            timeout: max seconds of silence after the keyword
+        """
+        self.keyword = keyword
+        self.on_detect = on_detect
+        self.on_speech = on_speech
+        self.duration = duration
+        self.timeout = timeout
+
+        self.pyaudio_instance = pyaudio_instance if pyaudio_instance else pyaudio.PyAudio()
+        self.quit_event = threading.Event()
+
+        indexes = find_devices(self.pyaudio_instance)
+        hids = respeaker.usb_hid.get_all()
+        self.devices = []
+        for index in indexes:
+            hid = self._find_hid(index, hids, len(indexes) == 1)
+            pixel_ring = PixelRing(hid if hid else False)
+            microphone = Microphone(self.pyaudio_instance, quit_event=self.quit_event,
+                                    decoder_process=decoder_process, device_index=index, pixel_ring=pixel_ring)
+            self.devices.append(Device(microphone))
+
+        logger.info('Found {} arrays'.format(len(self.devices)))
+
+        self.lock = threading.Lock()
+        self.queue = Queue.Queue()
+        self.threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+        self.start_time = None
+
+    def _find_hid(self, index, hids, single):
+        info = self.pyaudio_instance.get_device_info_by_index(index)
+        address = usb_address_of_audio_device(info)
+        if address is not None:
+            for hid in hids:
+                if usb_address_of_hid(hid) == address:
+                    return hid
+        elif single and len(hids) == 1:
+            # the topology is unknown (not ALSA), but one array can only have one interface
+            return hids[0]
+
+        logger.info('No USB HID interface found for {}'.format(info['name']))
+        return None
+
+    def start(self):
+        self.start_time = time.time()
+        for device in self.devices:
+            device.subscription = device.microphone._start_detect()
+            device.subscription.callback = lambda d=device: self._schedule(d)
+
+    def stats(self):
+        """
+        Returns:
+            list of dict with the counters of every array
+        """
+        elapsed = time.time() - self.start_time if self.start_time else 0
+        stats = []
+        for device in self.devices:
+            microphone = device.microphone
+            subscription = device.subscription
+            stats.append({
+                'device_index': microphone.device_index,
+                'bytes': microphone.bus.head,
+                'throughput': microphone.bus.head / elapsed if elapsed else 0.0,  # bytes per second
+                'chunks': device.chunks,
+                'detections': device.detections,
+                'backlog': subscription.available() if subscription else 0,
+                'overruns': subscription.overruns if subscription else 0,
+                'dropped': subscription.dropped if subscription else 0,
+                'overflows': microphone.overflows,
+                'leds': microphone.pixel_ring.stats(),
+            })
+
+        return stats
+
+    def close(self):
+        self.quit_event.set()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        for device in self.devices:
+            device.microphone.close()
+            device.microphone.pixel_ring.close()
+
+    def _schedule(self, device):
+        # called by the audio thread of the device
+        with self.lock:
+            if device.scheduled:
+                return
+            device.scheduled = True
+
+        self.queue.put(device)
+
+    def _work(self):
+        while True:
+            device = self.queue.get()
+            if device is None:
+                break
+
+            try:
+                self._process(device)
+            except Exception as e:
+                logger.exception('Failed to process audio of device {} - {}'.format(device.microphone.device_index, e))
+
+            with self.lock:
+                device.scheduled = False
+
+            subscription = device.subscription
+            if subscription.available() >= subscription.frame_bytes and not subscription.closed:
+                self._schedule(device)
+
+    def _process(self, device):
+        microphone = device.microphone
+        subscription = device.subscription
+        while not self.quit_event.is_set():
+            data = subscription.read(timeout=0)
+            if not data:
+                break
+
+            device.chunks += 1
+            if device.gate is None:
+                text = microphone._spot(data, self.keyword, subscription)
+                if not text:
+                    continue
+
+                device.detections += 1
+                if self.on_detect:
+                    self.on_detect(microphone, text)
+
+                if self.on_speech:
+                    device.gate = microphone._gate(self.duration, self.timeout)
+                    device.speech = []
+                    microphone.pixel_ring.listen()
+                else:
+                    microphone.decoder.end_utt()
+                    microphone.decoder.start_utt()
+            else:
+                device.speech.extend(device.gate.push(data))
+                if device.gate.done:
+                    device.gate = None
+                    microphone.pixel_ring.wait()
+                    speech = b''.join(device.speech)
+                    device.speech = []
+                    self.on_speech(microphone, speech)
+                    microphone.decoder.end_utt()
+                    microphone.decoder.start_utt()
+                    microphone.pixel_ring.off()
+
+
+def main():
+    logging.basicConfig(level=logging.DEBUG)
+
+    def on_detect(microphone, text):
+        print('Device {} detected {}'.format(microphone.device_index, text))
+
+    manager = MicrophoneManager(on_detect=on_detect)
+    manager.start()
+    while True:
+        try:
+            time.sleep(10)
+            for stats in manager.stats():
+                print(stats)
+        except KeyboardInterrupt:
+            break
+
+    manager.close()
+
+
+if __name__ == '__main__':
+    main()
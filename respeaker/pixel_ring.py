@@ -15,18 +15,59 @@
  limitations under the License.
 """
 
+import collections
+import logging
+import threading
+
+try: # Python 2 and Python <= 3.2
+    from monotonic import monotonic
+except: # Python >= 3.3
+    from time import monotonic
+
 import respeaker.usb_hid
+from respeaker.lazy import LazyInstance
 from respeaker.spi import spi
 
 
+logger = logging.getLogger('pixel_ring')
+
+
 class PixelRing:
+    """
+    LEDs of a ReSpeaker array
+
+    Commands are sent by a background thread, so a slow USB or SPI write never
+    blocks the caller, e.g. an audio thread. A command replaces any command of
+    the same kind (address and command byte) which has not been sent yet, e.g.
+    only the latest speak level matters, and commands are sent in the order of
+    their latest update, at most rate commands per second.
+    """
     mono_mode = 1
     listening_mode = 2
     waiting_mode = 3
     speaking_mode = 4
+    custom_mode = 6
+
+    # number of LEDs
+    pixels = 12
+
+    def __init__(self, hid=None, rate=30):
+        """
 
-    def __init__(self):
-        self.hid = respeaker.usb_hid.get()
+        Args:
+            hid: USB HID interface of the device, the first one found if None, False to use SPI only
+            rate: max commands sent per second
+        """
+        self.hid = hid if hid is not None else respeaker.usb_hid.get()
+        self.interval = 1.0 / rate
+        self.pending = collections.OrderedDict()  # (address, command) -> data
+        self.condition = threading.Condition()
+        self.busy = False
+        self.closed = False
+        self.thread = None
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
 
     def off(self):
         self.set_color(rgb=0)
@@ -52,6 +93,26 @@ class PixelRing:
     def set_volume(self, volume):
         self.write(0, [5, 0, 0, volume])
 
+    def show(self, colors):
+        """
+        Set the color of every LED
+
+        Args:
+            colors: list of 0xRRGGBB, one for each LED
+        """
+        self.write(0, self.pack(colors))
+
+    @classmethod
+    def pack(cls, colors):
+        """
+        Get the command which shows colors, 4 bytes (r, g, b, 0) for each LED after the mode
+        """
+        data = bytearray([cls.custom_mode, 0, 0, 0])
+        for rgb in colors:
+            data += bytearray([(rgb >> 16) & 0xFF, (rgb >> 8) & 0xFF, rgb & 0xFF, 0])
+
+        return data
+
     @staticmethod
     def to_bytearray(data):
         if type(data) is int:
@@ -68,20 +129,110 @@ class PixelRing:
         return array
 
     def write(self, address, data):
+        """
+        Queue a command, it returns without waiting for the command to be sent
+        """
         data = self.to_bytearray(data)
+        with self.condition:
+            if self.closed:
+                return
+
+            key = (address, data[0] if data else None)
+            if key in self.pending:
+                # sent after the commands queued before this one
+                del self.pending[key]
+                self.dropped += 1
+            self.pending[key] = data
+            self.condition.notify_all()
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def flush(self, timeout=None):
+        """
+        Wait until all queued commands are sent
+
+        Returns:
+            True if all commands are sent, False on timeout
+        """
+        deadline = monotonic() + timeout if timeout is not None else None
+        with self.condition:
+            while (self.pending or self.busy) and self.thread.is_alive():
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+
+        return True
+
+    def stats(self):
+        """
+        Returns:
+            dict with the queue depth and the number of sent, coalesced and failed commands
+        """
+        return {
+            'queued': len(self.pending),
+            'written': self.written,
+            'dropped': self.dropped,
+            'errors': self.errors,
+        }
+
+    def _run(self):
+        last = -self.interval
+        while True:
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+
+                if not self.pending:
+                    break
+
+                delay = last + self.interval - monotonic()
+                if delay > 0:
+                    # commands queued meanwhile replace the pending ones
+                    self.condition.wait(delay)
+                    continue
+
+                (address, _), data = self.pending.popitem(last=False)
+                self.busy = True
+
+            last = monotonic()
+            try:
+                self._write(address, data)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                logger.warning('Failed to write LED command - {}'.format(e))
+
+    def _write(self, address, data):
         length = len(data)
         if self.hid:
             packet = bytearray([address & 0xFF, (address >> 8) & 0xFF, length & 0xFF, (length >> 8) & 0xFF]) + data
             self.hid.write(packet)
-            print(packet)
         spi.write(address=address, data=data)
 
     def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        # the queued commands, e.g. off(), are sent before closing
+        if self.thread is not None:
+            self.thread.join()
+
         if self.hid:
             self.hid.close()
 
 
-pixel_ring = PixelRing()
+# USB is enumerated when pixel_ring is used for the first time
+pixel_ring = LazyInstance(PixelRing)
 
 
 if __name__ == '__main__':
@@ -107,3 +258,4 @@ if __name__ == '__main__':
             break
 
     pixel_ring.off()
+    pixel_ring.close()
@@ -0,0 +1,250 @@
+"""
+ Animate the LEDs of ReSpeaker arrays with precomputed frames
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import math
+import threading
+
+try: # Python 2 and Python <= 3.2
+    from monotonic import monotonic
+except: # Python >= 3.3
+    from time import monotonic
+
+from respeaker.pixel_ring import PixelRing
+
+PIXELS = PixelRing.pixels
+
+
+def scale(rgb, level):
+    """
+    Get 0xRRGGBB with the brightness multiplied by level (0.0 - 1.0)
+    """
+    r = int(((rgb >> 16) & 0xFF) * level)
+    g = int(((rgb >> 8) & 0xFF) * level)
+    b = int((rgb & 0xFF) * level)
+    return (r << 16) | (g << 8) | b
+
+
+class Animation(object):
+    """
+    Frames of a LED pattern, packed into commands when the animation is created
+
+    A looping animation is played frame by frame at fps. Other animations,
+    such as doa() or vu(), show one frame selected by the application.
+    """
+
+    def __init__(self, frames, fps=20, loop=True):
+        """
+
+        Args:
+            frames: list of frames, each a list of 0xRRGGBB for every LED
+            fps: frames per second when played
+            loop: if true, restart from the first frame after the last one
+        """
+        self.frames = [PixelRing.pack(colors) for colors in frames]
+        self.fps = fps
+        self.loop = loop
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame(self, position):
+        """
+        Get the command of the frame shown position seconds after the animation starts
+        """
+        index = int(position * self.fps)
+        if self.loop:
+            index %= len(self.frames)
+        else:
+            index = min(index, len(self.frames) - 1)
+
+        return self.frames[index]
+
+
+def spin(color=0x0000FF, tail=4, fps=12):
+    frames = []
+    for n in range(PIXELS):
+        colors = [0] * PIXELS
+        for i in range(tail):
+            colors[(n - i) % PIXELS] = scale(color, float(tail - i) / tail)
+        frames.append(colors)
+
+    return Animation(frames, fps)
+
+
+def breathe(color=0x00FF00, period=2.0, fps=20):
+    count = max(1, int(period * fps))
+    frames = []
+    for n in range(count):
+        level = (1 - math.cos(2 * math.pi * n / count)) / 2
+        frames.append([scale(color, level)] * PIXELS)
+
+    return Animation(frames, fps)
+
+
+def doa(color=0xFF0000, background=0x000010):
+    """
+    Point to a direction, show it with animator.show(ring, animation, doa_index(direction))
+    """
+    frames = []
+    for n in range(PIXELS):
+        colors = [background] * PIXELS
+        colors[n] = color
+        colors[(n - 1) % PIXELS] = scale(color, 0.25)
+        colors[(n + 1) % PIXELS] = scale(color, 0.25)
+        frames.append(colors)
+
+    return Animation(frames, loop=False)
+
+
+def doa_index(direction):
+    """
+    Get the LED pointing to direction in degrees
+    """
+    return int(round(direction * PIXELS / 360.0)) % PIXELS
+
+
+def vu(low=0x00FF00, high=0xFF0000):
+    """
+    Show a level, show it with animator.show(ring, animation, vu_index(level))
+    """
+    frames = []
+    for n in range(PIXELS + 1):
+        colors = [0] * PIXELS
+        for i in range(n):
+            colors[i] = low if i < PIXELS * 2 // 3 else high
+        frames.append(colors)
+
+    return Animation(frames, loop=False)
+
+
+def vu_index(level, maximum=1.0):
+    """
+    Get the frame of vu() for level between 0 and maximum
+    """
+    return max(0, min(PIXELS, int(round(float(level) * PIXELS / maximum))))
+
+
+class Animator(object):
+    """
+    Play animations on any number of PixelRings with one timer thread
+
+    Every tick only looks up precomputed frames and queues the ones which
+    changed, so the CPU usage stays flat with many devices. Each PixelRing
+    sends its commands from its own queue without blocking the timer.
+    """
+
+    def __init__(self, fps=20):
+        """
+
+        Args:
+            fps: ticks per second of the timer, the max frame rate of all animations
+        """
+        self.interval = 1.0 / fps
+        self.playing = {}
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def play(self, ring, animation):
+        """
+        Play a looping or one-shot animation on ring, replacing the current one
+        """
+        with self.condition:
+            # [animation, start time, last frame]
+            self.playing[ring] = [animation, monotonic(), None]
+            self.condition.notify()
+
+    def show(self, ring, animation, index):
+        """
+        Show a frame of animation on ring and stop playing
+        """
+        with self.condition:
+            self.playing.pop(ring, None)
+            ring.write(0, animation.frames[index])
+
+    def stop(self, ring):
+        with self.condition:
+            self.playing.pop(ring, None)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    def _run(self):
+        next_tick = monotonic()
+        while True:
+            with self.condition:
+                while not self.playing and not self.closed:
+                    self.condition.wait()
+                    next_tick = monotonic()
+
+                if self.closed:
+                    break
+
+                # PixelRing.write only queues the command, so it is done with the lock held
+                now = monotonic()
+                for ring, state in list(self.playing.items()):
+                    animation, start, last = state
+                    frame = animation.frame(now - start)
+                    if frame is not last:
+                        state[2] = frame
+                        ring.write(0, frame)
+                    elif not animation.loop and frame is animation.frames[-1]:
+                        del self.playing[ring]
+
+            next_tick += self.interval
+            delay = next_tick - monotonic()
+            if delay > 0:
+                with self.condition:
+                    if not self.closed:
+                        self.condition.wait(delay)
+            else:
+                # fell behind, do not try to catch up
+                next_tick = monotonic()
+
+
+if __name__ == '__main__':
+    import time
+    from respeaker.pixel_ring import pixel_ring
+
+    ring = pixel_ring.get()
+    animator = Animator()
+
+    animator.play(ring, spin())
+    time.sleep(3)
+    animator.play(ring, breathe())
+    time.sleep(4)
+
+    pointer = doa()
+    for direction in range(0, 720, 15):
+        animator.show(ring, pointer, doa_index(direction))
+        time.sleep(0.05)
+
+    meter = vu()
+    for level in range(0, 100, 5):
+        animator.show(ring, meter, vu_index(level, 100))
+        time.sleep(0.1)
+
+    animator.close()
+    ring.off()
+    ring.close()
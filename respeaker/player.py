@@ -16,6 +16,9 @@
 """
 
 import audioop
+import heapq
+import itertools
+import logging
 import threading
 import platform
 import subprocess
@@ -30,22 +33,192 @@ except: # Python 3
 
 import pyaudio
 
-from respeaker.pixel_ring import pixel_ring
 from respeaker.spectrum_analyzer import SpectrumAnalyzer
 from respeaker.spi import spi
 
 CHUNK_SIZE = 1024
 BAND_NUMBER = 16
 
+logger = logging.getLogger('player')
+
+
+class Source(object):
+    """
+    Audio played by Player, converted to 16 bit audio at the rate and channels of the output stream
+
+    A generator is read ahead by a thread up to prefetch seconds, so a slow
+    generator (e.g. a network TTS) never blocks the mixer. gain can be
+    changed while it is played.
+    """
+
+    def __init__(self, data, rate=16000, channels=1, width=2, gain=1.0, priority=0, spectrum=False,
+                 output_rate=16000, output_channels=1, prefetch=1.0):
+        if channels != output_channels and (channels, output_channels) not in ((1, 2), (2, 1)):
+            raise ValueError('Can not play {} channels audio on {} channels'.format(channels, output_channels))
+
+        self.rate = rate
+        self.channels = channels
+        self.width = width
+        self.gain = gain
+        self.priority = priority
+        self.spectrum = spectrum
+        self.output_rate = output_rate
+        self.output_channels = output_channels
+
+        self.buffer = bytearray()
+        self.remainder = b''
+        self.state = None
+        self.stopped = False
+        self.finished = False
+        self.condition = threading.Condition()
+        self.done = threading.Event()
+
+        if isinstance(data, types.GeneratorType):
+            self.chunks = data
+            self.limit = int(prefetch * output_rate) * output_channels * 2
+            self.thread = threading.Thread(target=self._prefetch)
+            self.thread.daemon = True
+            self.thread.start()
+        else:
+            step = CHUNK_SIZE * channels * width
+            self.chunks = (data[i:i + step] for i in range(0, len(data), step))
+            self.thread = None
+
+    def _convert(self, data):
+        # audioop works on whole frames only
+        data = self.remainder + bytes(data)
+        size = len(data) - len(data) % (self.channels * self.width)
+        data, self.remainder = data[:size], data[size:]
+
+        if self.width == 1:
+            # 8 bit WAV samples are unsigned
+            data = audioop.bias(data, 1, -128)
+        if self.width != 2:
+            data = audioop.lin2lin(data, self.width, 2)
+        if self.channels == 2 and self.output_channels == 1:
+            data = audioop.tomono(data, 2, 0.5, 0.5)
+        elif self.channels == 1 and self.output_channels == 2:
+            data = audioop.tostereo(data, 2, 1, 1)
+        if self.rate != self.output_rate:
+            data, self.state = audioop.ratecv(data, 2, self.output_channels, self.rate, self.output_rate, self.state)
+
+        return data
+
+    def _prefetch(self):
+        try:
+            for data in self.chunks:
+                data = self._convert(data)
+                with self.condition:
+                    while len(self.buffer) >= self.limit and not self.stopped:
+                        self.condition.wait()
+                    if self.stopped:
+                        break
+                    self.buffer.extend(data)
+        except Exception as e:
+            logger.warning('Failed to read audio - {}'.format(e))
+        finally:
+            if self.stopped:
+                self.chunks.close()
+            with self.condition:
+                self.finished = True
+
+    def read(self, size):
+        """
+        Read without blocking
+
+        Returns:
+            size bytes of converted audio, padded with silence while a generator is behind, less at the end
+        """
+        if self.stopped:
+            return b''
+
+        if self.thread is None:
+            while len(self.buffer) < size:
+                try:
+                    self.buffer.extend(self._convert(next(self.chunks)))
+                except StopIteration:
+                    break
+
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            return data
+
+        with self.condition:
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            finished = self.finished
+            self.condition.notify()
+
+        if len(data) < size and not finished:
+            data += b'\0' * (size - len(data))
+        return data
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
 
 class Player:
-    def __init__(self, pyaudio_instance=None):
+    """
+    Play audio through one output stream opened at start
+
+    A mixer thread sums the playing sources. Sources played with mix=True
+    start at once, the others are queued and played one by one, higher
+    priority first. While a source plays, sources of lower priority are
+    ducked to duck_gain.
+    """
+
+    def __init__(self, pyaudio_instance=None, rate=None, channels=None, frames_per_buffer=None, duck_gain=0.3):
+        """
+
+        Args:
+            pyaudio_instance: PyAudio instance to use, a new one is created if None
+            rate: sample rate of the output stream, the default rate of the output device if None
+            channels: channel number of the output stream, up to 2 channels of the output device if None
+            frames_per_buffer: frames mixed and written at a time, 10 ms if None, less is quicker to start a sound
+            duck_gain: gain of sources while a source of higher priority is played
+        """
         self.pyaudio_instance = pyaudio_instance if pyaudio_instance else pyaudio.PyAudio()
-        self.stop_event = threading.Event()
+
+        if rate is None or channels is None:
+            try:
+                info = self.pyaudio_instance.get_default_output_device_info()
+                default_rate = int(info['defaultSampleRate'])
+                default_channels = max(1, min(2, int(info['maxOutputChannels'])))
+            except (IOError, OSError):
+                default_rate, default_channels = 48000, 2
+
+            rate = rate if rate else default_rate
+            channels = channels if channels else default_channels
+
+        self.rate = rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer if frames_per_buffer else rate // 100
+        self.duck_gain = duck_gain
+
+        self.stream = self.pyaudio_instance.open(
+            format=self.pyaudio_instance.get_format_from_width(2),
+            channels=channels,
+            rate=rate,
+            output=True,
+            # output_device_index=1,
+            frames_per_buffer=self.frames_per_buffer,
+        )
+
+        self.condition = threading.Condition()
+        self.active = []
+        self.current = None
+        self.pending = []  # heap of (-priority, order, source)
+        self.order = itertools.count()
+        self.closed = False
 
         def ignite(queue):
             data = queue.get()
-            analyzer = SpectrumAnalyzer(len(data), band_number=BAND_NUMBER)
+            analyzer = SpectrumAnalyzer(len(data), sample_rate=self.rate, band_number=BAND_NUMBER)
             while True:
                 while not queue.empty():
                     data = queue.get()
@@ -67,33 +240,59 @@ class Player:
         self.thread.daemon = True
         self.thread.start()
 
-    def _play(self, data, rate=16000, channels=1, width=2, spectrum=True):
-        stream = self.pyaudio_instance.open(
-            format=self.pyaudio_instance.get_format_from_width(width),
-            channels=channels,
-            rate=rate,
-            output=True,
-            # output_device_index=1,
-            frames_per_buffer=CHUNK_SIZE,
-        )
-
-        if isinstance(data, types.GeneratorType):
-            for d in data:
-                if self.stop_event.is_set():
+        self.mixer_thread = threading.Thread(target=self._mix)
+        self.mixer_thread.daemon = True
+        self.mixer_thread.start()
+
+    def _mix(self):
+        size = self.frames_per_buffer * self.channels * 2
+        silence = b'\0' * size
+        while True:
+            with self.condition:
+                while not (self.closed or self.active or self.pending):
+                    self.condition.wait()
+                if self.closed:
                     break
 
-                stream.write(d)
-
+                if self.current is None and self.pending:
+                    self.current = heapq.heappop(self.pending)[2]
+                    self.active.append(self.current)
+                sources = list(self.active)
+
+            top = max(source.priority for source in sources)
+            mixed = None
+            spectrum = False
+            finished = []
+            for source in sources:
+                data = source.read(size)
+                if len(data) < size:
+                    finished.append(source)
+                    if not data:
+                        continue
+                    data += silence[len(data):]
+
+                gain = source.gain if source.priority >= top else source.gain * self.duck_gain
+                if gain != 1.0:
+                    data = audioop.mul(data, 2, gain)
+                mixed = data if mixed is None else audioop.add(mixed, data, 2)
+                spectrum = spectrum or source.spectrum
+
+            if mixed is not None:
+                self.stream.write(mixed)
                 if spectrum:
-                    if channels == 2:
-                        d = audioop.tomono(d, 2, 0.5, 0.5)
-                    self.queue.put(d)
-        else:
-            stream.write(data)
-
-        stream.close()
-
-    def play(self, wav=None, data=None, rate=16000, channels=1, width=2, block=True, spectrum=None):
+                    if self.channels == 2:
+                        mixed = audioop.tomono(mixed, 2, 0.5, 0.5)
+                    self.queue.put(mixed)
+
+            with self.condition:
+                for source in finished:
+                    self.active.remove(source)
+                    if source is self.current:
+                        self.current = None
+                    source.done.set()
+
+    def play(self, wav=None, data=None, rate=16000, channels=1, width=2, block=True, spectrum=None, priority=0,
+             gain=1.0, mix=False):
         """
         play wav file or raw audio (string or generator)
         Args:
@@ -104,6 +303,12 @@ class Player:
             width: raw audio data width, 16 bit is 2, only for raw data
             block: if true, block until audio is played.
             spectrum: if true, use a spectrum analyzer thread to analyze data
+            priority: queued sources of higher priority are played first and duck the lower ones
+            gain: gain of the audio
+            mix: if true, play at once over the current audio instead of queuing, e.g. for earcons
+
+        Returns:
+            Source of the audio, which can be stopped or waited for
         """
         if wav:
             f = wave.open(wav, 'rb')
@@ -120,12 +325,20 @@ class Player:
 
             data = gen(f)
 
-        self.stop_event.clear()
+        source = Source(data, rate, channels, width, gain, priority, bool(spectrum), self.rate, self.channels)
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('Player is closed')
+            if mix:
+                self.active.append(source)
+            else:
+                heapq.heappush(self.pending, (-priority, next(self.order), source))
+            self.condition.notify()
+
         if block:
-            self._play(data, rate, channels, width, spectrum)
-        else:
-            thread = threading.Thread(target=self._play, args=(data, rate, channels, width, spectrum))
-            thread.start()
+            source.wait()
+
+        return source
 
     def play_raw(self, data, rate=16000, channels=1, width=2):
         self.play(data=data, rate=rate, channels=channels, width=width)
@@ -170,10 +383,28 @@ class Player:
             p.wait()
 
     def stop(self):
-        self.stop_event.set()
+        """
+        Stop the playing and queued audio
+        """
+        with self.condition:
+            for source in self.active:
+                source.stop()
+            for _, _, source in self.pending:
+                source.stop()
+                source.done.set()
+            self.pending = []
 
     def close(self):
-        pass
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.mixer_thread.join()
+        self.stream.close()
+
+        for source in self.active:
+            source.done.set()
+        for _, _, source in self.pending:
+            source.done.set()
 
 
 def main():
@@ -0,0 +1,148 @@
+"""
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import threading
+
+
+class RingBuffer(object):
+    """
+    Single-producer single-consumer byte ring buffer
+
+    The producer (normally the PortAudio callback) and the consumer share a
+    preallocated bytearray and only exchange two ever increasing byte counters,
+    so neither side takes a lock to move data. When the consumer falls behind,
+    new data is dropped and counted in overruns/dropped.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.head = 0  # total bytes written, only changed by the producer
+        self.tail = 0  # total bytes read, only changed by the consumer
+        self.overruns = 0
+        self.dropped = 0
+        self.closed = False
+        self.event = threading.Event()
+
+    def available(self):
+        return self.head - self.tail
+
+    def free(self):
+        return self.size - (self.head - self.tail)
+
+    def write(self, data):
+        """
+        Append data, called by the producer
+
+        Returns:
+            number of bytes written, 0 when there is no room for the whole data
+        """
+        size = len(data)
+        if size > self.free():
+            self.overruns += 1
+            self.dropped += size
+            return 0
+
+        self._put(data)
+        self.event.set()
+
+        return size
+
+    def _put(self, data):
+        size = len(data)
+        data = memoryview(data)
+        start = self.head % self.size
+        first = min(size, self.size - start)
+        self.view[start:start + first] = data[:first]
+        if first < size:
+            self.view[:size - first] = data[first:]
+
+        self.head += size
+
+    def peek(self, size=None):
+        """
+        Get unread data without consuming it, called by the consumer
+
+        Returns:
+            memoryview of the contiguous readable region (at most size bytes). It stays valid until skip() is called
+        """
+        available = self.head - self.tail
+        if size is None or size > available:
+            size = available
+
+        start = self.tail % self.size
+        return self.view[start:start + min(size, self.size - start)]
+
+    def skip(self, size):
+        self.tail += min(size, self.head - self.tail)
+
+    def read(self, size, timeout=None):
+        """
+        Read size bytes, called by the consumer
+
+        Args:
+            size: bytes to read
+            timeout: seconds to wait for data, None to wait until data arrives or the buffer is closed
+
+        Returns:
+            bytes, shorter than size only when the buffer is closed, empty on timeout or when closed and drained
+        """
+        while self.head - self.tail < size and not self.closed:
+            self.event.clear()
+            if self.head - self.tail >= size or self.closed:
+                break
+            if not self.event.wait(timeout):
+                return b''
+
+        size = min(size, self.head - self.tail)
+        data = self.copy(self.tail, size)
+        self.tail += size
+
+        return data
+
+    def copy(self, position, size):
+        """
+        Copy size bytes starting at the absolute byte position (counted from the first byte ever written)
+        """
+        start = position % self.size
+        first = min(size, self.size - start)
+        if first < size:
+            return self.view[start:].tobytes() + self.view[:size - first].tobytes()
+
+        return self.view[start:start + size].tobytes()
+
+    def last(self, size):
+        """
+        Get the latest size bytes written, consumed or not
+        """
+        size = min(size, self.head, self.size)
+        return self.copy(self.head - size, size)
+
+    def clear(self):
+        """
+        Drop all unread data, called by the consumer
+        """
+        self.tail = self.head
+
+    def reset(self):
+        self.clear()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.event.set()
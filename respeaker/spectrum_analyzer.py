@@ -19,47 +19,119 @@ import array
 import math
 from respeaker.fft import FFT
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def hz_to_mel(f):
+    return 2595.0 * math.log10(1.0 + f / 700.0)
+
+
+def mel_to_hz(m):
+    return 700.0 * (math.pow(10.0, m / 2595.0) - 1.0)
+
+
+def hz_to_bark(f):
+    # Traunmuller's approximation
+    return 26.81 * f / (1960.0 + f) - 0.53
+
+
+def bark_to_hz(z):
+    return 1960.0 * (z + 0.53) / (26.28 - z)
+
+
+SCALES = {
+    'log': (math.log, math.exp),
+    'linear': (float, float),
+    'mel': (hz_to_mel, mel_to_hz),
+    'bark': (hz_to_bark, bark_to_hz),
+}
+
 
 class SpectrumAnalyzer:
-    def __init__(self, size, sample_rate=16000, band_number=12, window=[50, 8000]):
+    def __init__(self, size, sample_rate=16000, band_number=12, window=[50, 8000], scale='log', normalize=False):
+        """
+
+        Args:
+            size: frame size, rounded up to a power of 2
+            sample_rate: audio sample rate
+            band_number: number of bands
+            window: frequency range [low, high] covered by the bands
+            scale: band layout, 'log', 'linear', 'mel' or 'bark'
+            normalize: if true, divide the strength of each band by its number of bins
+        """
         self.size = 1 << math.frexp(size - 1)[1]
         self.sample_rate = float(sample_rate)
         self.resolution = self.sample_rate / self.size  # (sample_rate/2) / (band/2)
 
-        self.set_band(band_number, window)
+        self.set_band(band_number, window, scale, normalize)
 
         self.fft = FFT(self.size)
 
-    def set_band(self, n, window=[50, 8000]):
+    def set_band(self, n, window=[50, 8000], scale='log', normalize=False):
+        if scale not in SCALES:
+            raise ValueError('%s scale is not supported' % scale)
+
         self.band = n
+        self.scale = scale
+        self.normalize = normalize
         self.breakpoints = [0] * (n + 1)
         self.frequencies = [0.0] * (n + 1)
-        self.strength = [0.0] * n
 
-        delta = math.pow(float(window[1]) / window[0], 1.0 / n)
+        forward, backward = SCALES[scale]
+        low, high = forward(float(window[0])), forward(float(window[1]))
         for i in range(n + 1):
-            self.frequencies[i] = math.pow(delta, i) * window[0]
+            self.frequencies[i] = backward(low + (high - low) * i / n)
 
         breakpoint = 0
-        for i in range(1, self.size / 2):
+        for i in range(1, self.size // 2):
             if self.resolution * i >= self.frequencies[breakpoint]:
                 self.breakpoints[breakpoint] = i
                 breakpoint += 1
                 if breakpoint > n:
                     break
 
-        self.breakpoints[n] = self.size / 2 + 1
+        self.breakpoints[n] = self.size // 2 + 1
         self.band_size = [self.breakpoints[i + 1] - self.breakpoints[i] for i in range(n)]
-        # print self.frequencies
-        # print self.breakpoints
+        self.band_weight = [1.0 / size if normalize and size > 0 else 1.0 for size in self.band_size]
+
+        if numpy is not None:
+            # bins x bands projection, band strength of a frame is a single dot product
+            self.projection = numpy.zeros((self.size // 2 + 1, n), dtype=numpy.float32)
+            for i in range(n):
+                self.projection[self.breakpoints[i]:self.breakpoints[i + 1], i] = self.band_weight[i]
+            self.strength = numpy.zeros(n, dtype=numpy.float32)
+        else:
+            self.projection = None
+            self.strength = [0.0] * n
 
     def analyze(self, data):
         amplitude = self.fft.dft(data)
+        if self.projection is not None:
+            return numpy.dot(amplitude, self.projection, out=self.strength)
+
         for i in range(self.band):
-            self.strength[i] = sum(amplitude[self.breakpoints[i]:self.breakpoints[i + 1]])  # / self.band_size[i]
+            self.strength[i] = sum(amplitude[self.breakpoints[i]:self.breakpoints[i + 1]]) * self.band_weight[i]
 
         return self.strength
 
+    def analyze_many(self, data, hop=None, window=None):
+        """
+        Analyze a long recording frame by frame in one batch
+
+        Args:
+            data: S16_LE audio data (str/bytes), array.array or numpy array
+            hop: samples between the starts of two adjacent frames, half of the frame size by default
+            window: window function applied to every frame, None, 'hann', 'hamming', 'blackman' or an array
+
+        Returns:
+            frames x bands numpy array of band strength
+        """
+        amplitude = self.fft.dft_many(data, hop=hop, window=window)
+        return numpy.dot(amplitude, self.projection)
+
 
 if __name__ == '__main__':
     N = 2048
@@ -15,7 +15,25 @@
  limitations under the License.
 """
 
+import ctypes
+import glob
+import logging
+import os
 import platform
+import struct
+from threading import RLock
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+from respeaker import gpio_cdev
+from respeaker.gpio import Gpio, INPUT, OUTPUT
+from respeaker.ioctl import IOW
+from respeaker.lazy import LazyInstance
+
+logger = logging.getLogger('spi')
 
 
 CRC8_TABLE = (
@@ -55,109 +73,331 @@ CRC8_TABLE = (
 
 
 def crc8(data):
+    table = CRC8_TABLE
     result = 0
-    for b in data:
-        result = CRC8_TABLE[result ^ b]
+    for b in bytearray(data):
+        result = table[result ^ b]
     return result
 
 
-if platform.machine() == 'mips':
-    from gpio import *
-    from threading import RLock
-    import time
+def pack(address, data):
+    """
+    Get the frame of a message to the MCU: 0xA5, address, length, data, crc8 of data
+    """
+    data = bytearray(_to_bytes(data))
+    frame = bytearray([0xA5, address & 0xFF, len(data) & 0xFF])
+    frame += data
+    frame.append(crc8(data))
+    return frame
+
+
+MIPS = platform.machine() == 'mips'
+
+
+# spi_ioc_transfer of linux/spi/spidev.h
+class _Transfer(ctypes.Structure):
+    _fields_ = [
+        ('tx_buf', ctypes.c_uint64),
+        ('rx_buf', ctypes.c_uint64),
+        ('len', ctypes.c_uint32),
+        ('speed_hz', ctypes.c_uint32),
+        ('delay_usecs', ctypes.c_uint16),
+        ('bits_per_word', ctypes.c_uint8),
+        ('cs_change', ctypes.c_uint8),
+        ('tx_nbits', ctypes.c_uint8),
+        ('rx_nbits', ctypes.c_uint8),
+        ('word_delay_usecs', ctypes.c_uint8),
+        ('pad', ctypes.c_uint8),
+    ]
+
+
+SPI_IOC_WR_MODE = IOW('k', 1, 1)
+SPI_IOC_WR_BITS_PER_WORD = IOW('k', 3, 1)
+SPI_IOC_WR_MAX_SPEED_HZ = IOW('k', 4, 4)
+
+
+def SPI_IOC_MESSAGE(n):
+    return IOW('k', 0, n * ctypes.sizeof(_Transfer))
+
+
+def find_spidev():
+    """
+    Get the first spidev device on ReSpeaker Core, None if there is none
+    """
+    if not MIPS:
+        return None
+
+    devices = sorted(glob.glob('/dev/spidev*'))
+    return devices[0] if devices else None
 
 
-    class SPI:
-        def __init__(self, sck=15, mosi=17, miso=16, cs=14):
-            self.sck = Gpio(sck, OUTPUT)
-            self.mosi = Gpio(mosi, OUTPUT)
-            self.miso = Gpio(miso, INPUT)
-            self.cs = Gpio(cs, OUTPUT)
+def _to_bytes(data):
+    if type(data) is int:
+        return bytes(bytearray([data & 0xFF]))
+    elif type(data) in (bytearray, bytes):
+        return bytes(data)
+    elif type(data) is str:
+        return data.encode('latin-1')
+    else:
+        raise TypeError('%s is not supported' % type(data))
 
-            self.cs.write(1)
 
-            self.frequency(10000000)
-            self.format(8, 0)
-            self.lock = RLock()
+class SpidevTransport(object):
+    """
+    Full duplex transfers with one ioctl through the spidev driver
+    """
 
-        def frequency(self, hz=10000000):
-            self.freq = hz
+    def __init__(self, device, hz, mode):
+        self.fd = os.open(device, os.O_RDWR)
+        self.hz = hz
+        fcntl.ioctl(self.fd, SPI_IOC_WR_MODE, struct.pack('B', mode))
+        fcntl.ioctl(self.fd, SPI_IOC_WR_BITS_PER_WORD, struct.pack('B', 8))
+        fcntl.ioctl(self.fd, SPI_IOC_WR_MAX_SPEED_HZ, struct.pack('I', hz))
 
-        def format(self, bits=8, mode=0):
-            self.bits = bits
-            self.mode = mode
-            self.polarity = (mode >> 1) & 1
-            self.phase = mode & 1
-            self.sck.write(self.polarity)
+    def transfer(self, data):
+        length = len(data)
+        tx = ctypes.create_string_buffer(data, length)
+        rx = ctypes.create_string_buffer(length)
+        transfer = _Transfer(tx_buf=ctypes.addressof(tx), rx_buf=ctypes.addressof(rx), len=length,
+                             speed_hz=self.hz, bits_per_word=8)
+        fcntl.ioctl(self.fd, SPI_IOC_MESSAGE(1), ctypes.string_at(ctypes.addressof(transfer), ctypes.sizeof(transfer)))
 
-        def _exchange(self, data):
+        return bytearray(rx.raw)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _pwrite(fd, data):
+    os.lseek(fd, 0, os.SEEK_SET)
+    os.write(fd, data)
+
+
+def _pread(fd, size):
+    os.lseek(fd, 0, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+pwrite = (lambda fd, data: os.pwrite(fd, data, 0)) if hasattr(os, 'pwrite') else _pwrite
+pread = (lambda fd, size: os.pread(fd, size, 0)) if hasattr(os, 'pread') else _pread
+
+
+class BitBangTransport(object):
+    """
+    Software SPI through the GPIO value files
+
+    Every edge is one pwrite() on the value file instead of a write and a seek
+    of the buffered file, and MOSI is only written when the bit changes. The
+    MOSI levels of all byte values are computed when the transport is created.
+    """
+
+    # MOSI levels of the 8 bits of every byte, most significant bit first
+    LEVELS = tuple(tuple(b'1' if (byte >> bit) & 1 else b'0' for bit in range(7, -1, -1)) for byte in range(256))
+
+    def __init__(self, sck, mosi, miso, cs, mode):
+        self.sck = Gpio(sck, OUTPUT)
+        self.mosi = Gpio(mosi, OUTPUT)
+        self.miso = Gpio(miso, INPUT)
+        self.cs = Gpio(cs, OUTPUT)
+
+        self.polarity = (mode >> 1) & 1
+        self.phase = mode & 1
+        self.idle = b'1' if self.polarity else b'0'
+        self.active = b'0' if self.polarity else b'1'
+
+        self.cs.write(1)
+        self.sck.write(self.polarity)
+        self.mosi.write(0)
+        self.mosi_level = b'0'
+
+    def transfer(self, data):
+        sck = self.sck.fileno()
+        mosi = self.mosi.fileno()
+        miso = self.miso.fileno()
+        idle = self.idle
+        active = self.active
+        phase = self.phase
+        mosi_level = self.mosi_level
+        levels = self.LEVELS
+
+        response = bytearray(len(data))
+        pwrite(self.cs.fileno(), b'0')
+        for n, byte in enumerate(bytearray(data)):
+            read = 0
+            for level in levels[byte]:
+                if level != mosi_level:
+                    pwrite(mosi, level)
+                    mosi_level = level
+
+                if phase == 0:
+                    read = (read << 1) | (pread(miso, 1) == b'1')
+                pwrite(sck, active)
+                if phase == 1:
+                    read = (read << 1) | (pread(miso, 1) == b'1')
+                pwrite(sck, idle)
+
+            response[n] = read
+        pwrite(self.cs.fileno(), b'1')
+
+        self.mosi_level = mosi_level
+        return response
+
+    def close(self):
+        for gpio in (self.sck, self.mosi, self.miso, self.cs):
+            gpio.close()
+
+
+class LineBitBangTransport(object):
+    """
+    Software SPI through the GPIO character device
+
+    SCK, MOSI, CS and MISO are requested as one set of lines, so SCK and MOSI
+    change together with one ioctl. The line values of every byte are computed
+    when the transport is created.
+    """
+
+    # bits of the lines
+    SCK, MOSI, CS, MISO = 1, 2, 4, 8
+
+    def __init__(self, sck, mosi, miso, cs, mode):
+        lines = [gpio_cdev.find_line(number) for number in (sck, mosi, cs, miso)]
+        chip = lines[0][0]
+        if any(line[0] != chip for line in lines):
+            raise ValueError('SPI pins are on different GPIO chips')
+
+        polarity = (mode >> 1) & 1
+        self.phase = mode & 1
+        self.lines = gpio_cdev.GpioLines([line[1] for line in lines], [OUTPUT, OUTPUT, OUTPUT, INPUT], chip,
+                                         values=[polarity, 0, 1, 0])
+
+        idle = self.SCK if polarity else 0
+        active = idle ^ self.SCK
+        # (SCK idle, SCK active) with MOSI set to every bit of every byte, most significant bit first
+        self.steps = tuple(
+            tuple((idle | (self.MOSI if (byte >> bit) & 1 else 0), active | (self.MOSI if (byte >> bit) & 1 else 0))
+                  for bit in range(7, -1, -1))
+            for byte in range(256))
+        self.idle = idle
+
+    def transfer(self, data):
+        lines = self.lines
+        set_bits = lines.set_bits
+        get_bits = lines.get_bits
+        phase = self.phase
+        clock = self.SCK | self.MOSI
+        miso = self.MISO
+        steps = self.steps
+
+        response = bytearray(len(data))
+        set_bits(0, self.CS)
+        for n, byte in enumerate(bytearray(data)):
             read = 0
-            for bit in range(self.bits - 1, -1, -1):
-                self.mosi.write((data >> bit) & 0x01)
-
-                if 0 == self.phase:
-                    read |= self.miso.read() << bit
-
-                self.sck.write(1 - self.polarity)
-                # time.sleep(0.5 / self.freq)
-
-                if 1 == self.phase:
-                    read |= self.miso.read() << bit
-
-                self.sck.write(self.polarity)
-                # time.sleep(0.5 / self.freq)
-
-            return read
-
-        def _write(self, data):
-            response = bytearray()
-            self.cs.write(0)
-            if type(data) is int:
-                response.append(self._exchange(data))
-            elif type(data) is bytearray:
-                for b in data:
-                    response.append(self._exchange(b))
-            elif type(data) is str:
-                for b in bytearray(data):
-                    response.append(self._exchange(b))
-            elif type(data) is list:
-                for item in data:
-                    self.write(item)
+            for first, second in steps[byte]:
+                set_bits(first, clock)
+                if phase == 0:
+                    read = (read << 1) | (get_bits(miso) >> 3)
+                set_bits(second, clock)
+                if phase == 1:
+                    read = (read << 1) | (get_bits(miso) >> 3)
+
+            response[n] = read
+        set_bits(self.idle | self.CS, self.SCK | self.CS)
+
+        return response
+
+    def close(self):
+        self.lines.close()
+
+
+class SPI:
+    """
+    SPI master talking to the MCU of ReSpeaker
+
+    It uses the spidev driver when a spidev device is available, or bit-bangs
+    the GPIOs on ReSpeaker Core. It does nothing on other machines.
+    """
+
+    def __init__(self, sck=15, mosi=17, miso=16, cs=14, device=None, hz=1000000, mode=0):
+        """
+
+        Args:
+            sck, mosi, miso, cs: GPIO numbers for bit-banging
+            device: path of the spidev device, the first one found on ReSpeaker Core if None
+            hz: clock frequency of spidev transfers
+            mode: SPI mode, 0 - 3
+        """
+        self.lock = RLock()
+        self.hz = hz
+        self.mode = mode
+
+        device = device if device else find_spidev()
+        if device:
+            self.transport = SpidevTransport(device, hz, mode)
+        elif MIPS:
+            self.transport = None
+            if gpio_cdev.is_available():
+                try:
+                    self.transport = LineBitBangTransport(sck, mosi, miso, cs, mode)
+                except (IOError, OSError, ValueError) as e:
+                    logger.info('Can not use the GPIO character device, use sysfs instead - {}'.format(e))
+            if self.transport is None:
+                self.transport = BitBangTransport(sck, mosi, miso, cs, mode)
+        else:
+            self.transport = None
+
+    def _write(self, data):
+        if type(data) is list:
+            return [self._write(item) for item in data]
+
+        data = _to_bytes(data)
+        if self.transport is None:
+            return bytearray(len(data))
+
+        return self.transport.transfer(data)
+
+    def write(self, data=None, address=None):
+        with self.lock:
+            if address is not None:
+                response = self._write(bytes(pack(address, data)))[3:-1]
             else:
-                self.cs.write(1)
-                raise TypeError('%s is not supported' % type(data))
+                response = self._write(data)
 
-            self.cs.write(1)
             return response
 
-        def write(self, data=None, address=None):
-            with self.lock:
-                if address is not None:
-                    data = bytearray([0xA5, address & 0xFF, len(data) & 0xFF]) + data + bytearray([crc8(data)])
-                    response = self._write(data)[3:-1]
-                else:
-                    response = self._write(data)
+    def write_many(self, messages):
+        """
+        Send several messages in one transfer, e.g. LED and spectrum updates
 
-                return response
+        Args:
+            messages: list of (address, data)
 
-        def close(self):
-            pass
-else:
-    class SPI:
-        def __init__(self):
-            pass
+        Returns:
+            list of responses, one for each message
+        """
+        frames = bytearray()
+        spans = []
+        for address, data in messages:
+            frame = pack(address, data)
+            spans.append((len(frames) + 3, len(frames) + len(frame) - 1))
+            frames += frame
 
-        def write(self, data=None, address=None):
-            pass
+        with self.lock:
+            response = self._write(bytes(frames))
 
-        def close(self):
-            pass
+        return [response[start:end] for start, end in spans]
 
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
 
-spi = SPI()
+
+# GPIOs are exported when spi is used for the first time
+spi = LazyInstance(SPI)
 
 
 if __name__ == '__main__':
+    import time
+
     while True:
         spi.write('hello\n')
         time.sleep(1)
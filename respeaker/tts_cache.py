@@ -0,0 +1,269 @@
+"""
+ Cache of synthesized speech in memory and on disk
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger('tts')
+
+
+class _Synthesis(object):
+    # a synthesis in flight, which other requests of the same key wait for
+    def __init__(self):
+        self.event = threading.Event()
+        self.data = None
+        self.error = None
+
+
+class TTSCache(object):
+    """
+    Serve repeated prompts without asking the TTS service again
+
+    Speech is stored in a file named by the hash of (text, language, gender,
+    output format) and returned as a read-only mmap of the file, which can be
+    passed to Player.play(data=...). The most recently used mmaps are kept
+    open up to memory_size bytes, files are removed ttl seconds after they are
+    synthesized, and the least recently used files are removed when the
+    directory grows beyond disk_size bytes.
+    """
+
+    def __init__(self, tts, directory=None, memory_size=8 * 1024 * 1024, disk_size=64 * 1024 * 1024,
+                 ttl=30 * 24 * 3600):
+        """
+
+        Args:
+            tts: object with synthesize(text, language, gender), e.g. BingSpeechAPI
+            directory: where to store the speech, ~/.cache/respeaker/tts if None
+            memory_size: max bytes of speech kept mapped
+            disk_size: max bytes of speech stored on disk
+            ttl: seconds a synthesized speech can be used
+        """
+        self.tts = tts
+        self.directory = directory if directory else os.path.join(os.path.expanduser('~'), '.cache', 'respeaker', 'tts')
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        headers = getattr(tts, 'synthesize_headers', {})
+        self.output_format = headers.get('X-Microsoft-OutputFormat', '')
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        self.memory = collections.OrderedDict()  # key -> (mmap, time of synthesis)
+        self.memory_bytes = 0
+        self.synthesizing = {}  # key -> _Synthesis
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text, language='en-US', gender='Female'):
+        data = json.dumps([text, language, gender, self.output_format])
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def synthesize(self, text, language='en-US', gender='Female'):
+        """
+        Get the speech of text from the cache, or synthesize and store it
+
+        Returns:
+            mmap or bytes of the speech
+        """
+        key = self.key(text, language, gender)
+        with self.lock:
+            data = self._get(key)
+            if data is not None:
+                return data
+
+            synthesis = self.synthesizing.get(key)
+            if synthesis is None:
+                synthesis = self.synthesizing[key] = _Synthesis()
+                self.misses += 1
+                waiting = False
+            else:
+                waiting = True
+
+        if waiting:
+            synthesis.event.wait()
+            if synthesis.error is not None:
+                raise synthesis.error
+            return synthesis.data
+
+        try:
+            data = self.tts.synthesize(text, language, gender)
+            if data:
+                with self.lock:
+                    data = self._put(key, data)
+            synthesis.data = data
+            return data
+        except Exception as e:
+            synthesis.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.synthesizing[key]
+            synthesis.event.set()
+
+    def stream(self, text, language='en-US', gender='Female', chunk_size=4096):
+        """
+        Get the speech as a generator of chunks, which Player.play() can stop or analyze
+        """
+        data = self.synthesize(text, language, gender)
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    def warm_up(self, phrases, language='en-US', gender='Female', block=True):
+        """
+        Synthesize phrases which are not in the cache, e.g. at boot
+        """
+        def _warm_up():
+            for text in phrases:
+                try:
+                    self.synthesize(text, language, gender)
+                except Exception as e:
+                    logger.warning('Failed to synthesize "{}" - {}'.format(text, e))
+
+        if block:
+            _warm_up()
+        else:
+            thread = threading.Thread(target=_warm_up)
+            thread.daemon = True
+            thread.start()
+
+    def stats(self):
+        """
+        Returns:
+            dict with hits in memory, hits on disk, misses, bytes mapped and entries in memory
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_bytes': self.memory_bytes,
+                'entries': len(self.memory),
+            }
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pcm')
+
+    def _get(self, key):
+        now = time.time()
+        entry = self.memory.pop(key, None)
+        if entry is not None:
+            data, created = entry
+            if now - created < self.ttl:
+                self.memory[key] = entry
+                self._touch(key, now, created)
+                self.hits += 1
+                return data
+
+            self.memory_bytes -= len(data)
+            self._remove(key)
+            return None
+
+        path = self._path(key)
+        try:
+            created = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        if now - created >= self.ttl:
+            self._remove(key)
+            return None
+
+        data = self._map(key, created)
+        self._touch(key, now, created)
+        self.disk_hits += 1
+        return data
+
+    def _put(self, key, data):
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(temporary, self._path(key))
+        except Exception:
+            os.remove(temporary)
+            raise
+
+        self._limit_disk(key)
+        return self._map(key, time.time())
+
+    def _map(self, key, created):
+        with open(self._path(key), 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        replaced = self.memory.pop(key, None)
+        if replaced is not None:
+            self.memory_bytes -= len(replaced[0])
+        self.memory[key] = (data, created)
+        self.memory_bytes += len(data)
+        while self.memory_bytes > self.memory_size and len(self.memory) > 1:
+            _, (evicted, _) = self.memory.popitem(last=False)
+            # not closed, it may still be played
+            self.memory_bytes -= len(evicted)
+
+        return data
+
+    def _touch(self, key, now, created):
+        # the access time orders the files for eviction, the modification time is kept for the ttl
+        try:
+            os.utime(self._path(key), (now, created))
+        except OSError:
+            pass
+
+    def _remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _limit_disk(self, keep):
+        files = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pcm'):
+                continue
+            if name == keep + '.pcm':
+                total += os.path.getsize(os.path.join(self.directory, name))
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+
+        files.sort()
+        for _, size, path in files:
+            if total <= self.disk_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,91 @@
+"""
+ Synthesize long text sentence by sentence
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import collections
+import re
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+CHUNK_SIZE = 4096
+
+# a sentence ends with .!?; followed by a space, or with a CJK full stop
+SENTENCE = re.compile(u'.+?(?:[.!?;]+(?=\\s|$)|[\u3002\uff01\uff1f\uff1b]+|$)', re.S)
+
+
+def split_sentences(text):
+    """
+    Split text into sentences, a number like "3.5" is not split
+    """
+    sentences = []
+    for sentence in SENTENCE.findall(text):
+        sentence = sentence.strip()
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+def synthesize(tts, text, language='en-US', gender='Female', workers=3, chunk_size=CHUNK_SIZE):
+    """
+    Synthesize sentences of text concurrently and yield the audio in order
+
+    The first chunk is available as soon as the first sentence is synthesized,
+    and the next workers - 1 sentences are synthesized while it is played.
+    Pass the generator to Player.play(data=...), which writes all sentences
+    to one output stream without gaps.
+
+    Args:
+        tts: object with synthesize(text, language, gender), e.g. BingSpeechAPI or TTSCache
+        text: text to synthesize
+        language: language of the text
+        gender: gender of the voice
+        workers: max sentences synthesized at the same time
+        chunk_size: bytes of the yielded chunks
+
+    Returns:
+        generator of raw audio in the output format of tts
+    """
+    if ThreadPoolExecutor is None:
+        raise RuntimeError('concurrent.futures is required, install futures on Python 2')
+
+    sentences = iter(split_sentences(text))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = collections.deque()
+    try:
+        for sentence in sentences:
+            pending.append(executor.submit(tts.synthesize, sentence, language, gender))
+            if len(pending) >= workers:
+                break
+
+        while pending:
+            data = pending.popleft().result()
+            for sentence in sentences:
+                pending.append(executor.submit(tts.synthesize, sentence, language, gender))
+                break
+
+            if data:
+                for start in range(0, len(data), chunk_size):
+                    yield data[start:start + chunk_size]
+    finally:
+        # stopped or failed, do not synthesize the rest
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -15,54 +15,86 @@
  limitations under the License.
 """
 
+import importlib
 import os
 import logging
-from respeaker.usb_hid.hidapi_backend import HidApiUSB
-from respeaker.usb_hid.pyusb_backend import PyUSB
-from respeaker.usb_hid.pywinusb_backend import PyWinUSB
 
+# backend name: (module, class), a backend is imported only when it is considered
 INTERFACE = {
-             'hidapiusb': HidApiUSB,
-             'pyusb': PyUSB,
-             'pywinusb': PyWinUSB,
+             'hidapiusb': ('respeaker.usb_hid.hidapi_backend', 'HidApiUSB'),
+             'pyusb': ('respeaker.usb_hid.pyusb_backend', 'PyUSB'),
+             'pywinusb': ('respeaker.usb_hid.pywinusb_backend', 'PyWinUSB'),
             }
 
 # Allow user to override backend with an environment variable.
 usb_backend = os.getenv('PYOCD_USB_BACKEND', "")
 
-# Check validity of backend env var.
-if usb_backend and ((usb_backend not in INTERFACE.keys()) or (not INTERFACE[usb_backend].isAvailable)):
-    logging.error("Invalid USB backend specified in PYOCD_USB_BACKEND: " + usb_backend)
-    usb_backend = ""
-
-# Select backend based on OS and availability.
-if not usb_backend:
-    if os.name == "nt":
-        # Prefer hidapi over pyWinUSB for Windows, since pyWinUSB has known bug(s)
-        if HidApiUSB.isAvailable:
-            usb_backend = "hidapiusb"
-        elif PyWinUSB.isAvailable:
-            usb_backend = "pywinusb"
+backend = None
+
+
+def load(name):
+    module, cls = INTERFACE[name]
+    return getattr(importlib.import_module(module), cls)
+
+
+def get_backend():
+    """
+    Select and import the USB backend on first use
+    """
+    global backend, usb_backend
+
+    if backend:
+        return backend
+
+    # Check validity of backend env var.
+    if usb_backend and ((usb_backend not in INTERFACE.keys()) or (not load(usb_backend).isAvailable)):
+        logging.error("Invalid USB backend specified in PYOCD_USB_BACKEND: " + usb_backend)
+        usb_backend = ""
+
+    # Select backend based on OS and availability.
+    if not usb_backend:
+        if os.name == "nt":
+            # Prefer hidapi over pyWinUSB for Windows, since pyWinUSB has known bug(s)
+            if load('hidapiusb').isAvailable:
+                usb_backend = "hidapiusb"
+            elif load('pywinusb').isAvailable:
+                usb_backend = "pywinusb"
+            else:
+                raise Exception("No USB backend found")
+        elif os.name == "posix":
+            # Select hidapi for OS X and pyUSB for Linux.
+            if os.uname()[0] == 'Darwin':
+                usb_backend = "hidapiusb"
+            else:
+                usb_backend = "pyusb"
         else:
             raise Exception("No USB backend found")
-    elif os.name == "posix":
-        # Select hidapi for OS X and pyUSB for Linux.
-        if os.uname()[0] == 'Darwin':
-            usb_backend = "hidapiusb"
-        else:
-            usb_backend = "pyusb"
-    else:
-        raise Exception("No USB backend found")
 
+    backend = load(usb_backend)
+    return backend
 
-devices = None
 
+def scan(known=None):
+    """
+    Enumerate the connected interfaces, reusing the ones in known which are still connected
+    """
+    interface = get_backend()
+    if interface.isAvailable:
+        return interface.getAllConnectedInterface(known)
 
-def get(index=0):
-    global devices
+    return []
+
+
+def get_all():
+    """
+    returns the connected interfaces, cached by the device registry until a USB hotplug event
+    """
+    from respeaker.device_registry import registry
 
-    if not devices:
-        if INTERFACE[usb_backend].isAvailable:
-            devices = INTERFACE[usb_backend].getAllConnectedInterface()
-    if devices and len(devices) > index:
+    return registry.hid_interfaces()
+
+
+def get(index=0):
+    devices = get_all()
+    if len(devices) > index:
         return devices[index]
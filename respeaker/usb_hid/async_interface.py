@@ -0,0 +1,83 @@
+"""
+ Asyncio interface of USB HID (Python 3.7+)
+
+ ReSpeaker Python Library
+ Copyright (c) 2016 Seeed Technology Limited.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+
+import asyncio
+
+
+class AsyncInterface(object):
+    """
+    Await reports of a PyUSB interface in an asyncio event loop
+
+    The reader thread of the interface only schedules a wakeup with
+    loop.call_soon_threadsafe when a coroutine is waiting. Writes run in
+    the default executor, as a USB transfer may block. The loop is the running
+    loop of the first read or write if None.
+    """
+
+    def __init__(self, interface, loop=None):
+        self.interface = interface
+        self.loop = loop
+        self.waiter = None
+        self.closed = False
+        interface.rx_callback = self._wake
+
+    def _wake(self):
+        # called by the reader thread
+        waiter = self.waiter
+        if waiter is not None:
+            self.loop.call_soon_threadsafe(self._set, waiter)
+
+    @staticmethod
+    def _set(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    async def read(self, timeout=None):
+        """
+        read a report, raises asyncio.TimeoutError after timeout seconds, or an exception when closed
+        """
+        interface = self.interface
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        while True:
+            self.waiter = self.loop.create_future()
+            try:
+                with interface.rcv_condition:
+                    if interface.rcv_data:
+                        return interface.rcv_data.popleft()
+
+                if self.closed or interface.closed:
+                    raise Exception("Interface closed")
+
+                await asyncio.wait_for(self.waiter, timeout)
+            finally:
+                self.waiter = None
+
+    async def write(self, data):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        await self.loop.run_in_executor(None, self.interface.write, data)
+
+    def close(self):
+        self.closed = True
+        self.interface.rx_callback = None
+        with self.interface.rcv_condition:
+            self.interface.rcv_condition.notify_all()
+        # wake a waiting read to raise
+        self._wake()
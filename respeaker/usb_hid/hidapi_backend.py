@@ -15,7 +15,7 @@
  limitations under the License.
 """
 
-from respeaker.usb_hid.interface import Interface
+from respeaker.usb_hid.interface import Interface, findInterface
 import logging, os
 
 try:
@@ -47,10 +47,10 @@ class HidApiUSB(Interface):
         pass
 
     @staticmethod
-    def getAllConnectedInterface():
+    def getAllConnectedInterface(known=None):
         """
         returns all the connected devices which matches HidApiUSB.vid/HidApiUSB.pid.
-        returns an array of HidApiUSB (Interface) objects
+        returns an array of HidApiUSB (Interface) objects, reusing the ones in known which are still connected
         """
 
         devices = hid.enumerate()
@@ -67,6 +67,11 @@ class HidApiUSB(Interface):
                 # Skip non cmsis-dap devices
                 continue
 
+            board = findInterface(known, deviceInfo['vendor_id'], deviceInfo['product_id'], deviceInfo['path'])
+            if board:
+                boards.append(board)
+                continue
+
             try:
                 dev = hid.device(vendor_id=deviceInfo['vendor_id'], product_id=deviceInfo['product_id'],
                     path=deviceInfo['path'])
@@ -81,6 +86,7 @@ class HidApiUSB(Interface):
             new_board.serial_number = deviceInfo['serial_number']
             new_board.vid = deviceInfo['vendor_id']
             new_board.pid = deviceInfo['product_id']
+            new_board.path = deviceInfo['path']
             new_board.device_info = deviceInfo
             new_board.device = dev
             try:
@@ -23,6 +23,8 @@ class Interface(object):
         self.pid = 0
         self.vendor_name = ""
         self.product_name = ""
+        self.serial_number = ""
+        self.path = ""
         self.packet_count = 1
         return
 
@@ -41,6 +43,9 @@ class Interface(object):
                str(hex(self.vid)) + ", " + \
                str(hex(self.pid)) + ")"
 
+    def getKey(self):
+        return (self.vid, self.pid, self.serial_number, self.path)
+
     def setPacketCount(self, count):
         # Unless overridden the packet count cannot be changed
         return
@@ -50,3 +55,12 @@ class Interface(object):
 
     def close(self):
         return
+
+
+def findInterface(interfaces, vid, pid, path):
+    """
+    returns the interface of interfaces which is at path, or None
+    """
+    for interface in interfaces or ():
+        if interface.vid == vid and interface.pid == pid and interface.path == path:
+            return interface
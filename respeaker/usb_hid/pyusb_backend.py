@@ -15,8 +15,13 @@
  limitations under the License.
 """
 
-from respeaker.usb_hid.interface import Interface
-import logging, os, threading
+from respeaker.usb_hid.interface import Interface, findInterface
+import logging, os, threading, collections
+
+try: # Python 2 and Python <= 3.2
+    from monotonic import monotonic
+except: # Python >= 3.3
+    from time import monotonic
 
 try:
     import usb.core
@@ -39,41 +44,94 @@ class PyUSB(Interface):
 
     isAvailable = isAvailable
 
+    # max reports kept when nobody reads them, older ones are dropped
+    max_rcv_data = 64
+
+    # ms the reader thread waits for a report before checking whether the interface is closed
+    rx_timeout = 100
+
     def __init__(self):
         super(PyUSB, self).__init__()
         self.ep_out = None
         self.ep_in = None
         self.dev = None
         self.closed = False
-        self.rcv_data = []
-        self.read_sem = threading.Semaphore(0)
+        self.rcv_data = collections.deque()
+        self.rcv_condition = threading.Condition()
+        self.rcv_dropped = 0
+        # called by the reader thread after a report is received, e.g. to wake an event loop
+        self.rx_callback = None
+        self.thread = None
 
     def start_rx(self):
         self.thread = threading.Thread(target=self.rx_task)
         self.thread.daemon = True
         self.thread.start()
 
+    @staticmethod
+    def _is_timeout(error):
+        timeout_error = getattr(usb.core, 'USBTimeoutError', None)
+        if timeout_error is not None and isinstance(error, timeout_error):
+            return True
+        # ETIMEDOUT of older PyUSB, LIBUSB_ERROR_TIMEOUT
+        return getattr(error, 'errno', None) == 110 or getattr(error, 'backend_error_code', None) == -7
+
     def rx_task(self):
+        # read continuously, so reports sent by the device on its own (status, DOA, keys) are received
         while not self.closed:
-            self.read_sem.acquire()
-            if not self.closed:
-                # Timeouts appear to corrupt data occasionally.  Because of this the
-                # timeout is set to infinite.
-                self.rcv_data.append(self.ep_in.read(self.ep_in.wMaxPacketSize, -1))
+            try:
+                data = self.ep_in.read(self.ep_in.wMaxPacketSize, self.rx_timeout)
+            except usb.core.USBError as e:
+                if self._is_timeout(e):
+                    continue
+                if not self.closed:
+                    logging.error('Failed to read HID report - {}'.format(e))
+                    self.closed = True
+                break
+
+            with self.rcv_condition:
+                if len(self.rcv_data) >= self.max_rcv_data:
+                    self.rcv_data.popleft()
+                    self.rcv_dropped += 1
+                self.rcv_data.append(data)
+                self.rcv_condition.notify_all()
+
+            if self.rx_callback is not None:
+                self.rx_callback()
+
+        # wake the readers to raise
+        with self.rcv_condition:
+            self.rcv_condition.notify_all()
+        if self.rx_callback is not None:
+            self.rx_callback()
 
     @staticmethod
-    def getAllConnectedInterface():
+    def getAllConnectedInterface(known=None):
         """
         returns all the connected devices which matches PyUSB.vid/PyUSB.pid.
-        returns an array of PyUSB (Interface) objects
+        returns an array of PyUSB (Interface) objects, reusing the ones in known which are still connected
         """
         # find all devices matching the vid/pid specified
-        dev = usb.core.find(idVendor=0x2886, idProduct=0x0007)
+        all_devices = usb.core.find(find_all=True, idVendor=0x2886, idProduct=0x0007)
 
-        if not dev:
+        boards = []
+        for dev in all_devices:
+            board = findInterface(known, dev.idVendor, dev.idProduct, '%d-%d' % (dev.bus, dev.address))
+            if not board:
+                board = PyUSB.open(dev)
+            if board:
+                boards.append(board)
+
+        if not boards:
             logging.debug("No device connected")
-            return []
 
+        return boards
+
+    @staticmethod
+    def open(dev):
+        """
+        returns a PyUSB (Interface) object of the HID interface of dev, or None
+        """
         interface_number = -1
 
         # get active config
@@ -87,7 +145,7 @@ class PyUSB(Interface):
                 break
 
         if interface_number == -1:
-            return []
+            return None
 
         try:
             if dev.is_kernel_driver_active(interface_number):
@@ -105,16 +163,24 @@ class PyUSB(Interface):
         """If there is no EP for OUT then we can use CTRL EP"""
         if not ep_in:
             logging.error('Endpoints not found')
-            return []
+            return None
 
         board = PyUSB()
+        board.vid = dev.idVendor
+        board.pid = dev.idProduct
+        board.path = '%d-%d' % (dev.bus, dev.address)
+        try:
+            if dev.iSerialNumber:
+                board.serial_number = usb.util.get_string(dev, dev.iSerialNumber)
+        except Exception as e:
+            logging.debug('Failed to read serial number - {}'.format(e))
         board.ep_in = ep_in
         board.ep_out = ep_out
         board.dev = dev
         board.intf_number = interface_number
         board.start_rx()
 
-        return [board]
+        return board
 
     def write(self, data):
         """
@@ -128,8 +194,6 @@ class PyUSB(Interface):
         # for _ in range(report_size - len(data)):
         #    data.append(0)
 
-        self.read_sem.release()
-
         if not self.ep_out:
             bmRequestType = 0x21       #Host to device request of type Class of Recipient Interface
             bmRequest = 0x09           #Set_REPORT (HID class-specific request for transferring data over EP0)
@@ -144,13 +208,26 @@ class PyUSB(Interface):
         return
 
 
-    def read(self):
+    def read(self, timeout=-1):
         """
         read data on the IN endpoint associated to the HID interface
+        waits at most timeout seconds for a report, forever if timeout is negative
         """
-        while len(self.rcv_data) == 0:
-            pass
-        return self.rcv_data.pop(0)
+        deadline = monotonic() + timeout if timeout >= 0 else None
+        with self.rcv_condition:
+            while not self.rcv_data:
+                if self.closed:
+                    raise Exception("Interface closed")
+
+                if deadline is None:
+                    self.rcv_condition.wait()
+                else:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        raise Exception("Read timed out")
+                    self.rcv_condition.wait(remaining)
+
+            return self.rcv_data.popleft()
 
     def setPacketCount(self, count):
         # No interface level restrictions on count
@@ -165,6 +242,11 @@ class PyUSB(Interface):
         """
         logging.debug("closing interface")
         self.closed = True
-        self.read_sem.release()
-        self.thread.join()
+        with self.rcv_condition:
+            self.rcv_condition.notify_all()
+        if self.rx_callback is not None:
+            self.rx_callback()
+        # the reader returns from its timed read, the device is not disposed under it
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
         usb.util.dispose_resources(self.dev)
@@ -15,7 +15,7 @@
  limitations under the License.
 """
 
-from respeaker.usb_hid.interface import Interface
+from respeaker.usb_hid.interface import Interface, findInterface
 import logging, os, collections
 from time import time
 
@@ -60,9 +60,9 @@ class PyWinUSB(Interface):
         self.device.open(shared=False)
 
     @staticmethod
-    def getAllConnectedInterface():
+    def getAllConnectedInterface(known=None):
         """
-        returns all the connected CMSIS-DAP devices
+        returns all the connected CMSIS-DAP devices, reusing the ones in known which are still connected
         """
         all_devices = hid.find_all_hid_devices()
 
@@ -74,6 +74,11 @@ class PyWinUSB(Interface):
 
         boards = []
         for dev in all_mbed_devices:
+            board = findInterface(known, dev.vendor_id, dev.product_id, dev.device_path)
+            if board:
+                boards.append(board)
+                continue
+
             try:
                 dev.open(shared=False)
                 report = dev.find_output_reports()
@@ -85,6 +90,7 @@ class PyWinUSB(Interface):
                     new_board.serial_number = dev.serial_number
                     new_board.vid = dev.vendor_id
                     new_board.pid = dev.product_id
+                    new_board.path = dev.device_path
                     new_board.device = dev
                     new_board.device.set_raw_data_handler(new_board.rx_handler)
 
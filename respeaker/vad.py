@@ -16,75 +16,124 @@
 """
 
 import collections
-import sys
+import logging
 
-import webrtcvad
+
+logger = logging.getLogger('vad')
 
 
 class WebRTCVAD:
-    def __init__(self, sample_rate=16000, level=0):
+    def __init__(self, sample_rate=16000, level=0, frame_ms=30, onset=4, hangover=8, trace=False):
         """
 
         Args:
             sample_rate: audio sample rate
             level: between 0 and 3. 0 is the least aggressive about filtering out non-speech, 3 is the most aggressive.
+            frame_ms: frame length passed to webrtcvad, 10, 20 or 30 ms
+            onset: speech starts when this many of the last hangover frames are voiced
+            hangover: speech ends after this many frames without voice
+            trace: if true, log the decision of every frame at debug level
         """
+        import webrtcvad
+
+        if frame_ms not in (10, 20, 30):
+            raise ValueError('frame_ms should be 10, 20 or 30')
+
+        if not 0 < onset <= hangover:
+            raise ValueError('onset should be between 1 and hangover')
+
         self.sample_rate = sample_rate
+        self.trace = trace
 
-        self.frame_ms = 30
+        self.frame_ms = frame_ms
         self.frame_bytes = int(2 * self.frame_ms * self.sample_rate / 1000)   # S16_LE, 2 bytes width
+        self.onset = onset
 
         self.vad = webrtcvad.Vad(level)
         self.active = False
-        self.data = b''
+
+        # pending audio is buffer[:length], frames are passed to webrtcvad as memoryview slices
+        self.buffer = bytearray(self.frame_bytes * 4)
+        self.view = memoryview(self.buffer)
+        self.length = 0
+
         self.history = collections.deque(maxlen=128)
+        self.history_sum = 0
+        self.window = collections.deque(maxlen=hangover)
+        self.window_sum = 0
 
     def is_speech(self, data):
-        self.data += data
-        while len(self.data) >= self.frame_bytes:
-            frame = self.data[:self.frame_bytes]
-            self.data = self.data[self.frame_bytes:]
-
-            if self.vad.is_speech(frame, self.sample_rate):
-                sys.stdout.write('1')
-                self.history.append(1)
-            else:
-                sys.stdout.write('0')
-                self.history.append(0)
-
-            num_voiced = 0
-            for i in range(-8, 0):
-                try:
-                    num_voiced += self.history[i]
-                except IndexError:
-                    continue
-
-            if not self.active:
-                if num_voiced >= 4:
-                    sys.stdout.write('+')
-                    self.active = True
-                    break
-                elif len(self.history) == self.history.maxlen and sum(self.history) == 0:
-                    sys.stdout.write('Todo: increase capture volume')
-                    for _ in range(self.history.maxlen // 2):
-                        self.history.popleft()
-
-            else:
-                if num_voiced < 1:
-                    sys.stdout.write('-')
-                    self.active = False
-                elif sum(self.history) > self.history.maxlen * 0.9:
-                    sys.stdout.write('Todo: decrease capture volume')
-                    for _ in range(int(self.history.maxlen / 2)):
-                        self.history.popleft()
+        size = len(data)
+        if self.length + size > len(self.buffer):
+            buffer = bytearray(max(len(self.buffer) * 2, self.length + size))
+            buffer[:self.length] = self.view[:self.length]
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+
+        self.view[self.length:self.length + size] = data
+        self.length += size
+
+        offset = 0
+        while self.length - offset >= self.frame_bytes:
+            frame = self.view[offset:offset + self.frame_bytes]
+            offset += self.frame_bytes
+
+            if self.update(1 if self.vad.is_speech(frame, self.sample_rate) else 0):
+                break
+
+        if offset:
+            rest = self.length - offset
+            self.buffer[:rest] = self.buffer[offset:self.length]
+            self.length = rest
 
         return self.active
 
+    def update(self, voiced):
+        """
+        Update the state with the decision of a frame
+
+        Returns:
+            True if speech starts at this frame
+        """
+        if self.trace:
+            logger.debug(voiced)
+
+        if len(self.history) == self.history.maxlen:
+            self.history_sum -= self.history[0]
+        self.history.append(voiced)
+        self.history_sum += voiced
+
+        if len(self.window) == self.window.maxlen:
+            self.window_sum -= self.window[0]
+        self.window.append(voiced)
+        self.window_sum += voiced
+
+        if not self.active:
+            if self.window_sum >= self.onset:
+                logger.debug('+')
+                self.active = True
+                return True
+            elif len(self.history) == self.history.maxlen and self.history_sum == 0:
+                logger.info('Todo: increase capture volume')
+                self.drop_history()
+        else:
+            if self.window_sum < 1:
+                logger.debug('-')
+                self.active = False
+            elif self.history_sum > self.history.maxlen * 0.9:
+                logger.info('Todo: decrease capture volume')
+                self.drop_history()
+
+        return False
+
+    def drop_history(self):
+        for _ in range(self.history.maxlen // 2):
+            self.history_sum -= self.history.popleft()
+
     def reset(self):
-        self.data = b''
+        self.length = 0
         self.active = False
         self.history.clear()
-
-
-vad = WebRTCVAD()
-
+        self.history_sum = 0
+        self.window.clear()
+        self.window_sum = 0